@@ -5,6 +5,9 @@ Initializes all modules and starts the bot.
 
 import asyncio
 import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # Import all modules to register handlers
 from src.core.config import config
@@ -13,17 +16,63 @@ from src.bot.client import client, start_client, run_until_disconnected, stop_cl
 from src.handlers.command_handlers import start_handler, help_handler, status_handler
 from src.handlers.callback_handlers import callback_handler
 from src.handlers.message_handlers import message_handler
+from src.downloads.download_manager import download_manager
+from src.utils.path_utils import path_manager
 
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE = 'bot.log'
+# The log file is rotated at this size, keeping LOG_BACKUPS old files, so it never grows unbounded
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+
+# Threads beyond the download writers, for directory scans and other blocking calls
+EXTRA_IO_THREADS = 4
+
+def setup_logging() -> QueueListener:
+    """Route log records through a queue so handlers write from a background thread."""
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        logging.StreamHandler(),
+        RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Loggers only enqueue records; stream and file writes never block the event loop
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
 async def main():
     """Main function to start the bot."""
     logger.info("Starting Telegram File Downloader Bot...")
     
+    # Size the pool behind asyncio.to_thread for every concurrent range writer,
+    # instead of the CPU-based default that is small on little containers
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(
+            max_workers=config.max_concurrent_downloads * config.parallel_parts + EXTRA_IO_THREADS,
+            thread_name_prefix="io",
+        )
+    )
+    
+    # Validate the allowed base directories once, so later checks need no syscalls
+    path_manager.set_allowed_base_dirs(config.allowed_base_dirs)
+    
     try:
         # Start the Telegram client
         await start_client()
         logger.info("Bot connected successfully")
+        user_state.start_idle_user_purger(config.idle_user_ttl)
         print('Bot is running... Press Ctrl+C to stop.')
         
         # Run the bot until disconnected
@@ -36,8 +85,13 @@ async def main():
         raise
     finally:
         logger.info("Bot shutting down")
+        await download_manager.stop()
         await stop_client()
 
 if __name__ == '__main__':
-    logger.info("Initializing bot application")
-    asyncio.run(main()) 
\ No newline at end of file
+    log_listener = setup_logging()
+    try:
+        logger.info("Initializing bot application")
+        asyncio.run(main())
+    finally:
+        log_listener.stop() 
\ No newline at end of file
@@ -5,63 +5,113 @@ Handles client initialization and connection management.
 
 import asyncio
 import logging
+import time
+from functools import lru_cache
+from typing import Optional
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
+from telethon.network import ConnectionTcpAbridged
+from telethon.sessions import SQLiteSession
 
 from ..core.config import get_config
 from ..core.user_state import UserState
 
 logger = logging.getLogger(__name__)
 
-# Get configuration
-config = get_config()
-
 # Initialize user state
 user_state = UserState()
 
-# Initialize Telegram client
-client = TelegramClient(
-    config.session_name,
-    config.api_id,
-    config.api_hash
-)
-logger.info("Telethon client initialized with optimized settings")
+class TunedSQLiteSession(SQLiteSession):
+    """SQLite session that journals to a WAL instead of syncing the file on every commit."""
+
+    def _cursor(self):
+        if self._conn is None:
+            cursor = super()._cursor()
+            # Session updates are small and frequent; WAL with synchronous=NORMAL
+            # only syncs on checkpoints while staying safe across crashes
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            return cursor
+        return super()._cursor()
+
+@lru_cache(maxsize=None)
+def get_client() -> TelegramClient:
+    """Get the shared Telegram client, creating it (and its session) on first use."""
+    config = get_config()
+    client = TelegramClient(
+        TunedSQLiteSession(config.session_name),
+        config.api_id,
+        config.api_hash,
+        # One-byte length prefix per packet instead of TcpFull's length, seqno and CRC32
+        connection=ConnectionTcpAbridged,
+        connection_retries=config.connection_retries,
+        retry_delay=config.retry_delay,
+        timeout=config.timeout,
+        request_retries=config.request_retries,
+        flood_sleep_threshold=config.flood_sleep_threshold,
+    )
+    logger.info("Telethon client initialized with optimized settings")
+    return client
+
+def __getattr__(name: str):
+    """Resolve ``client`` lazily so importing this module never opens a session."""
+    if name == 'client':
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Cached login state; None forces a fresh get_me() check
+_logged_in_cache: Optional[bool] = None
+# time.monotonic_ns() after which the cached state is checked again
+_logged_in_expires = 0
+
+def set_logged_in_cache(logged_in: Optional[bool]) -> None:
+    """Record the client login state for login_cache_ttl, or pass None to force a re-check."""
+    global _logged_in_cache, _logged_in_expires
+    _logged_in_cache = logged_in
+    _logged_in_expires = time.monotonic_ns() + int(get_config().login_cache_ttl * 1_000_000_000)
 
 async def is_logged_in() -> bool:
     """Check if the client is logged in."""
+    if _logged_in_cache is not None and time.monotonic_ns() < _logged_in_expires:
+        return _logged_in_cache
     try:
-        me = await client.get_me()
+        me = await get_client().get_me()
         username = getattr(me, 'username', 'Unknown')
         user_id = getattr(me, 'id', 'Unknown')
-        logger.info(f"User logged in: {username} ({user_id})")
+        logger.info("User logged in: %s (%s)", username, user_id)
+        set_logged_in_cache(True)
         return True
     except Exception as e:
-        logger.warning(f"Not logged in: {e}")
+        logger.warning("Not logged in: %s", e)
+        set_logged_in_cache(None)
         return False
 
 async def start_client() -> None:
     """Start the Telegram client."""
     logger.info("Starting Telegram client...")
+    set_logged_in_cache(None)
     try:
-        await client.start(bot_token=config.bot_token)
+        await get_client().start(bot_token=get_config().bot_token)
         logger.info("Telegram client connected successfully")
     except Exception as e:
-        logger.error(f"Failed to start Telegram client: {e}")
+        logger.error("Failed to start Telegram client: %s", e)
         raise
 
 async def stop_client() -> None:
     """Stop the Telegram client."""
     logger.info("Stopping Telegram client...")
+    set_logged_in_cache(None)
     try:
-        await client.disconnect()
+        await get_client().disconnect()
         logger.info("Telegram client disconnected successfully")
     except Exception as e:
-        logger.error(f"Error stopping Telegram client: {e}")
+        logger.error("Error stopping Telegram client: %s", e)
 
 async def run_until_disconnected() -> None:
     """Run the client until disconnected."""
     try:
-        await client.run_until_disconnected()
+        await get_client().run_until_disconnected()
     except Exception as e:
-        logger.error(f"Client disconnected with error: {e}")
+        logger.error("Client disconnected with error: %s", e)
+        set_logged_in_cache(None)
         raise 
\ No newline at end of file
@@ -6,86 +6,173 @@ Handles environment variables, settings, and validation.
 import os
 import logging
 import pathlib
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Optional
 from dotenv import load_dotenv
 
 logger = logging.getLogger("src.core.config")
 
+# Shown in logs in place of secrets; their length is not revealed either
+REDACTED = "<redacted>"
+
+@lru_cache(maxsize=None)
+def _load_dotenv_once() -> bool:
+    """Load .env into the environment once per process; variables already set win."""
+    return load_dotenv()
+
+# Telethon clamps each download request to MAX_REQUEST_SIZE bytes; the adaptive
+# request size moves between MIN_REQUEST_SIZE and the configured chunk size
+MAX_REQUEST_SIZE = 512 * 1024
+MIN_REQUEST_SIZE = 128 * 1024
+
+@dataclass(frozen=True, slots=True)
 class Config:
     """Configuration class for the bot."""
+    api_id: int
+    api_hash: str
+    bot_token: str
+    allowed_users: FrozenSet[int] = frozenset()
+    # Optional base directories that folders and downloads must stay under
+    allowed_base_dirs: FrozenSet[str] = frozenset()
+    
+    # Bot settings
+    session_name: str = 'downloader_bot_session'
+    base_download_dir: str = '.'
     
-    def __init__(self):
-        # Load environment variables
-        load_dotenv()
-        
-        # Debug: Check if .env file exists and what's loaded
-        env_path = pathlib.Path('.env')
-        logger.info(f".env file exists: {env_path.exists()}")
-        logger.info(f"Current working directory: {pathlib.Path.cwd()}")
-        
-        # Check what's actually loaded
-        logger.info(f"API_ID from env: {repr(os.getenv('API_ID'))}")
-        logger.info(f"API_HASH from env: {repr(os.getenv('API_HASH'))}")
-        logger.info(f"BOT_TOKEN from env: {repr(os.getenv('BOT_TOKEN'))}")
-        logger.info(f"ALLOWED_USERS from env: {repr(os.getenv('ALLOWED_USERS'))}")
-        
-        # Load configuration
-        self.api_id = os.getenv('API_ID')
-        self.api_hash = os.getenv('API_HASH')
-        self.bot_token = os.getenv('BOT_TOKEN')
-        
-        # Parse allowed users, handling whitespace and empty values
-        allowed_users_str = os.getenv('ALLOWED_USERS', '')
-        if allowed_users_str.strip():
-            self.allowed_users = {user.strip() for user in allowed_users_str.split(',') if user.strip()}
-        else:
-            self.allowed_users = set()
-        
-        # Bot settings
-        self.session_name = 'downloader_bot_session'
-        self.base_download_dir = '.'
-        
-        # Download settings
-        self.download_chunk_size = 1024 * 1024  # 1MB chunks
-        self.progress_update_interval = 5.0  # Update progress every 5 seconds
-        self.max_concurrent_downloads = 5
-        self.notification_cooldown = 30  # Minimum seconds between notifications per user
-        
-        # Connection settings
-        self.connection_retries = 5
-        self.retry_delay = 1
-        self.timeout = 30
-        self.request_retries = 5
-        self.flood_sleep_threshold = 60
-        
-        self._validate_config()
-        self._log_config()
+    # Download settings
+    download_chunk_size: int = MAX_REQUEST_SIZE  # Bytes per request, the ceiling for the adaptive request size
+    min_download_chunk_size: int = MIN_REQUEST_SIZE  # Floor for the adaptive request size
+    chunk_growth_successes: int = 8  # Clean fetches before the request size doubles again
+    # Total bytes of write buffers, shared evenly by every concurrent stream (downloads x parts).
+    # Each buffer holds at least one request, so the worst case in use is
+    # max(budget, max_concurrent_downloads * parallel_parts * download_chunk_size): 10 MiB by default
+    write_buffer_budget: int = 8 * 1024 * 1024
+    parallel_parts: int = 4  # Byte ranges of a large document fetched concurrently (1 disables)
+    progress_update_interval: float = 5.0  # Update progress every 5 seconds
+    max_concurrent_downloads: int = 5
+    notification_cooldown: int = 30  # Minimum seconds between notifications per user
+    status_refresh_debounce: float = 0.75  # Minimum seconds between status refreshes per user
+    completed_download_ttl: int = 3600  # Seconds a completed download stays listed
+    login_cache_ttl: float = 60.0  # Seconds a login check is trusted before get_me() runs again
+    idle_user_ttl: int = 3600  # Seconds an idle, not logged-in user's state is kept
+    download_retries: int = 3  # Retries after a flood wait or dropped connection
+    retry_backoff_base: float = 1.0  # Retry n sleeps Uniform(0, base * factor**n) seconds
+    retry_backoff_factor: float = 2.0
+    retry_backoff_cap: float = 30.0  # Upper bound on a single backoff sleep
+    retry_guard_window: int = 20  # Recent fetch attempts considered by the retry guard
+    retry_guard_failure_rate: float = 0.5  # Failure share above which retries stop
+    retry_guard_cooldown: float = 60.0  # Seconds retries stay disabled once tripped
     
-    def _validate_config(self):
-        """Validate required configuration values."""
-        if not self.api_id or not self.api_hash or not self.bot_token:
-            logger.error("Missing required environment variables")
-            raise ValueError('API_ID, API_HASH, and BOT_TOKEN must be set in the environment variables.')
-        
-        # Convert API_ID to int
+    # Connection settings
+    connection_retries: int = 5
+    retry_delay: int = 1
+    timeout: int = 30
+    request_retries: int = 5
+    flood_sleep_threshold: int = 60
+
+# Numeric settings that may be overridden from the environment, by variable name,
+# with the inclusive range they must fall in (None leaves that side open)
+_NUMERIC_ENV_SETTINGS = {
+    'DOWNLOAD_CHUNK_SIZE': ('download_chunk_size', MIN_REQUEST_SIZE, MAX_REQUEST_SIZE),
+    'PARALLEL_PARTS': ('parallel_parts', 1, None),
+    'MAX_CONCURRENT_DOWNLOADS': ('max_concurrent_downloads', 1, None),
+    'DOWNLOAD_RETRIES': ('download_retries', 0, None),
+    'PROGRESS_UPDATE_INTERVAL': ('progress_update_interval', 1, None),
+    'NOTIFICATION_COOLDOWN': ('notification_cooldown', 0, None),
+    'COMPLETED_DOWNLOAD_TTL': ('completed_download_ttl', 0, None),
+}
+
+def _parse_numeric_settings() -> Dict[str, Any]:
+    """Parse numeric overrides from the environment once, typed by their Config field."""
+    field_types = {field.name: field.type for field in fields(Config)}
+    settings = {}
+    for env_name, (field_name, minimum, maximum) in _NUMERIC_ENV_SETTINGS.items():
+        value = os.getenv(env_name, '').strip()
+        if not value:
+            continue
+        parse = field_types[field_name]
         try:
-            self.api_id = int(self.api_id)
+            number = parse(value)
         except ValueError:
-            raise ValueError('API_ID must be a valid integer.')
-        
-        logger.info(f"API_ID converted to int: {self.api_id}")
+            raise ValueError(f'{env_name} must be a valid {parse.__name__}.')
+        # Zero workers, parts or chunk bytes would stall or break downloads
+        if minimum is not None and number < minimum:
+            raise ValueError(f'{env_name} must be at least {minimum}.')
+        if maximum is not None and number > maximum:
+            raise ValueError(f'{env_name} must be at most {maximum}.')
+        settings[field_name] = number
+    return settings
+
+def _parse_list(value: str) -> FrozenSet[str]:
+    """Parse a comma-separated setting, handling whitespace and empty values."""
+    return frozenset(item.strip() for item in value.split(',') if item.strip())
+
+def _parse_user_ids(value: str) -> FrozenSet[int]:
+    """Parse ALLOWED_USERS into Telegram user ids, so auth checks compare ints."""
+    try:
+        return frozenset(int(item) for item in _parse_list(value))
+    except ValueError:
+        raise ValueError('ALLOWED_USERS must be a comma-separated list of integer user IDs.')
+
+def _validate_config(api_id: Optional[str], api_hash: Optional[str], bot_token: Optional[str]) -> int:
+    """Validate required configuration values and return API_ID as an int."""
+    if not api_id or not api_hash or not bot_token:
+        logger.error("Missing required environment variables")
+        raise ValueError('API_ID, API_HASH, and BOT_TOKEN must be set in the environment variables.')
+    
+    # Convert API_ID to int
+    try:
+        api_id_int = int(api_id)
+    except ValueError:
+        raise ValueError('API_ID must be a valid integer.')
+    
+    logger.debug("API_ID converted to int: %s", api_id_int)
+    return api_id_int
+
+def _log_config(config: Config) -> None:
+    """Log configuration details (without sensitive data)."""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info("Loaded environment variables - API_ID: %s, API_HASH: %s, BOT_TOKEN: %s", config.api_id, REDACTED, REDACTED)
+    logger.info("Allowed users: %s", config.allowed_users)
+    logger.info("Configuration validation completed successfully")
+
+def build_config() -> Config:
+    """Read and validate settings from the environment and build a Config."""
+    # Load environment variables, parsing .env only on the first build
+    _load_dotenv_once()
+    
+    # Debug: Check if .env file exists and what's loaded; the stat and cwd
+    # lookups only run when debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(".env file exists: %s", pathlib.Path('.env').exists())
+        logger.debug("Current working directory: %s", pathlib.Path.cwd())
+        logger.debug("API_ID from env: %r", os.getenv('API_ID'))
+        logger.debug("ALLOWED_USERS from env: %r", os.getenv('ALLOWED_USERS'))
+    
+    api_hash = os.getenv('API_HASH')
+    bot_token = os.getenv('BOT_TOKEN')
+    api_id = _validate_config(os.getenv('API_ID'), api_hash, bot_token)
     
-    def _log_config(self):
-        """Log configuration details (without sensitive data)."""
-        logger.info(f"Loaded environment variables - API_ID: {self.api_id}, API_HASH: {'*' * len(self.api_hash) if self.api_hash else 'None'}, BOT_TOKEN: {'*' * len(self.bot_token) if self.bot_token else 'None'}")
-        logger.info(f"Allowed users: {self.allowed_users}")
-        logger.info("Configuration validation completed successfully")
+    config = Config(
+        api_id=api_id,
+        api_hash=api_hash,
+        bot_token=bot_token,
+        allowed_users=_parse_user_ids(os.getenv('ALLOWED_USERS', '')),
+        allowed_base_dirs=_parse_list(os.getenv('ALLOWED_BASE_DIRS', '')),
+        **_parse_numeric_settings(),
+    )
+    _log_config(config)
+    return config
 
-# Global configuration instance - created lazily when needed
-_config_instance = None
+@lru_cache(maxsize=None)
+def get_config() -> Config:
+    """Get the global configuration instance, building it on first use."""
+    return build_config()
 
-def get_config():
-    """Get the global configuration instance."""
-    global _config_instance
-    if _config_instance is None:
-        _config_instance = Config()
-    return _config_instance 
\ No newline at end of file
+def __getattr__(name: str):
+    """Resolve ``config`` lazily so importing this module never reads the environment."""
+    if name == 'config':
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
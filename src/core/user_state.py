@@ -3,69 +3,139 @@ User state management module for the Telegram File Downloader Bot.
 Handles user sessions, states, and state transitions.
 """
 
+import asyncio
 import logging
-from typing import Dict, Any, Optional
+import time
+from dataclasses import dataclass, field, fields
+from typing import AbstractSet, Dict, Any, Optional
 
 logger = logging.getLogger()  # Use root logger for testability
 
+# Seconds between sweeps for users idle longer than the idle TTL
+IDLE_USER_PURGE_INTERVAL = 300.0
+
+@dataclass(slots=True)
+class UserSession:
+    """State and data of a single user, mutated in place on each transition."""
+    # Possible states: None, 'awaiting_phone', 'awaiting_code', 'awaiting_2fa', 'logged_in', 'selecting_directory', 'awaiting_filename', 'awaiting_folder_name'
+    state: Optional[str] = None
+    chat_id: Optional[int] = None
+    phone: Optional[str] = None
+    code: Optional[str] = None
+    file_message: Any = None
+    original_filename: Optional[str] = None
+    selected_dir: Optional[str] = None
+    create_folder_path: Optional[str] = None
+    # Data without a dedicated field
+    extra: Dict[str, Any] = field(default_factory=dict)
+    # time.monotonic() of the last write, for evicting idle users
+    last_touch: float = field(default_factory=time.monotonic)
+
+_SESSION_FIELDS = frozenset(f.name for f in fields(UserSession)) - {'extra', 'last_touch'}
+
 class UserState:
     """User state management class."""
     
     def __init__(self):
         # Track user login state
-        self.user_states: Dict[str, Dict[str, Any]] = {}
-        # Possible states: None, 'awaiting_phone', 'awaiting_code', 'awaiting_2fa', 'logged_in', 'selecting_directory', 'awaiting_filename', 'awaiting_folder_name'
+        self.user_states: Dict[str, UserSession] = {}
+        # Drops users that have been idle for longer than the idle TTL
+        self.idle_purger: Optional[asyncio.Task] = None
+    
+    def _session(self, user_id: str) -> UserSession:
+        """Get the session of a user for writing, creating it if needed."""
+        session = self.user_states.get(user_id)
+        if session is None:
+            session = self.user_states[user_id] = UserSession()
+        else:
+            session.last_touch = time.monotonic()
+        return session
     
     def get_state(self, user_id: str) -> Optional[str]:
         """Get the current state of a user."""
-        return self.user_states.get(user_id, {}).get('state')
+        session = self.user_states.get(user_id)
+        return session.state if session else None
     
     def set_state(self, user_id: str, state: str, **kwargs) -> None:
         """Set the state of a user with additional data."""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {}
-        
-        self.user_states[user_id]['state'] = state
-        self.user_states[user_id].update(kwargs)
-        logger.info(f"User {user_id} state changed to: {state}")
+        session = self._session(user_id)
+        session.state = state
+        for key, value in kwargs.items():
+            self._set_field(session, key, value)
+        logger.info("User %s state changed to: %s", user_id, state)
     
     def get_user_data(self, user_id: str, key: str, default=None) -> Any:
         """Get specific data for a user."""
-        return self.user_states.get(user_id, {}).get(key, default)
+        session = self.user_states.get(user_id)
+        if session is None:
+            return default
+        if key in _SESSION_FIELDS:
+            value = getattr(session, key)
+            return default if value is None else value
+        return session.extra.get(key, default)
     
     def set_user_data(self, user_id: str, key: str, value: Any) -> None:
         """Set specific data for a user."""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {}
-        self.user_states[user_id][key] = value
+        self._set_field(self._session(user_id), key, value)
     
     def update_user_data(self, user_id: str, **kwargs) -> None:
         """Update multiple data fields for a user."""
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {}
-        self.user_states[user_id].update(kwargs)
+        session = self._session(user_id)
+        for key, value in kwargs.items():
+            self._set_field(session, key, value)
+    
+    @staticmethod
+    def _set_field(session: UserSession, key: str, value: Any) -> None:
+        """Set a session field, keeping unknown keys in its extra data."""
+        if key in _SESSION_FIELDS:
+            setattr(session, key, value)
+        else:
+            session.extra[key] = value
     
     def clear_user_state(self, user_id: str) -> None:
         """Clear all state data for a user."""
-        if user_id in self.user_states:
-            del self.user_states[user_id]
-            logger.info(f"Cleared state for user {user_id}")
+        if self.user_states.pop(user_id, None) is not None:
+            logger.info("Cleared state for user %s", user_id)
     
     def is_logged_in(self, user_id: str) -> bool:
         """Check if a user is logged in."""
         return self.get_state(user_id) == 'logged_in'
     
-    def is_authorized(self, user_id: str, allowed_users: set) -> bool:
+    def is_authorized(self, user_id: int, allowed_users: AbstractSet[int]) -> bool:
         """Check if a user is authorized to use the bot."""
         return user_id in allowed_users
     
     def get_chat_id(self, user_id: str) -> Optional[int]:
         """Get the chat ID for a user."""
-        return self.get_user_data(user_id, 'chat_id')
+        session = self.user_states.get(user_id)
+        return session.chat_id if session else None
     
     def set_chat_id(self, user_id: str, chat_id: int) -> None:
         """Set the chat ID for a user."""
-        self.set_user_data(user_id, 'chat_id', chat_id)
+        self._session(user_id).chat_id = chat_id
+    
+    def evict_idle_users(self, ttl: float) -> int:
+        """Drop users not written to for ttl seconds, keeping logged-in ones."""
+        cutoff = time.monotonic() - ttl
+        idle = [
+            user_id for user_id, session in self.user_states.items()
+            if session.last_touch < cutoff and session.state != 'logged_in'
+        ]
+        for user_id in idle:
+            del self.user_states[user_id]
+            logger.debug("Evicted idle state for user %s", user_id)
+        return len(idle)
+    
+    def start_idle_user_purger(self, ttl: float) -> None:
+        """Start the idle user purger task if it is not already running."""
+        if self.idle_purger is None or self.idle_purger.done():
+            self.idle_purger = asyncio.create_task(self.purge_idle_users(ttl))
+    
+    async def purge_idle_users(self, ttl: float) -> None:
+        """Periodically evict users idle for longer than ttl seconds."""
+        while True:
+            await asyncio.sleep(IDLE_USER_PURGE_INTERVAL)
+            self.evict_idle_users(ttl)
 
 # Global user state instance
 user_state = UserState() 
\ No newline at end of file
@@ -6,12 +6,22 @@ Handles file downloads, progress tracking, and queue management.
 import os
 import asyncio
 import logging
-import threading
+import random
 import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Optional
-from telethon.errors import MessageNotModifiedError
+from collections import OrderedDict, defaultdict, deque
+from itertools import islice
+from typing import Callable, Collection, Deque, Dict, List, Optional, Sequence
+from telethon.errors import (
+    FileReferenceExpiredError,
+    FloodWaitError,
+    MessageNotModifiedError,
+)
+from telethon.extensions import markdown
+from telethon.tl.custom import Message
+from telethon.tl.functions.messages import EditMessageRequest
+from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
 
+from ..bot import client as bot_client
 from ..core.config import get_config
 from ..core.user_state import user_state
 
@@ -21,87 +31,550 @@ logger = logging.getLogger(__name__)
 config = get_config()
 
 
+# Bytes per megabyte, for progress and status display
+MB = 1 << 20
+# Its reciprocal, exact for a power of two, so per-task renders multiply instead of divide
+INV_MB = 1 / MB
+
+# Users whose notification cooldown is remembered before the oldest is evicted
+MAX_NOTIFICATION_COOLDOWNS = 10_000
+
+# Telegram's limit on the text of one message, for batched notifications
+MAX_MESSAGE_LENGTH = 4096
+
+# Seconds between sweeps for completed downloads older than completed_download_ttl
+COMPLETED_PURGE_INTERVAL = 300.0
+
+
+# Idle write buffers kept for reuse; buffers in use are bounded by write_buffer_budget
+_BUFFER_POOL: deque = deque(maxlen=config.max_concurrent_downloads)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Jittered exponential backoff so concurrent workers don't retry in lockstep."""
+    return min(
+        config.retry_backoff_cap,
+        random.uniform(
+            0, config.retry_backoff_base * config.retry_backoff_factor**attempt
+        ),
+    )
+
+
+def write_buffer_size() -> int:
+    """Bytes per write buffer: an even share of the budget in whole requests, at least one."""
+    streams = config.max_concurrent_downloads * config.parallel_parts
+    share = config.write_buffer_budget // streams
+    return max(config.download_chunk_size, share - share % config.download_chunk_size)
+
+
+def acquire_buffer() -> bytearray:
+    """Take a write buffer from the pool, allocating one if the pool is empty."""
+    try:
+        return _BUFFER_POOL.pop()
+    except IndexError:
+        return bytearray(write_buffer_size())
+
+
+def release_buffer(buffer: bytearray) -> None:
+    """Return a write buffer to the pool for the next download."""
+    _BUFFER_POOL.append(buffer)
+
+
+def _write_all(fd: int, data: memoryview) -> None:
+    """Write a buffer to a file descriptor, finishing any short write."""
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def _open_for_download(path: str, size: int) -> int:
+    """Open a download target for writing, reserving its full size up front when known."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    if size > 0 and hasattr(os, "posix_fallocate"):
+        try:
+            # One contiguous reservation instead of growing the file chunk by chunk
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            logger.debug(f"Could not preallocate {path}: {e}")
+    return fd
+
+
+def _pwrite_all(fd: int, data: memoryview, offset: int) -> None:
+    """Write a buffer at a file offset, finishing any short write."""
+    while data:
+        written = os.pwrite(fd, data, offset)
+        data = data[written:]
+        offset += written
+
+
+# Task statuses counted per user, and those shown as active downloads
+_STATUS_COUNTERS = frozenset({"queued", "downloading", "completed", "failed"})
+_ACTIVE_STATUSES = frozenset({"queued", "downloading"})
+
+
+class UserDownloadStats:
+    """Per-user download counters, kept current as tasks change state."""
+
+    __slots__ = (
+        "queued",
+        "downloading",
+        "completed",
+        "failed",
+        "bytes_downloaded",
+        "bytes_total",
+        "active",
+    )
+
+    def __init__(self):
+        self.queued = 0
+        self.downloading = 0
+        self.completed = 0
+        self.failed = 0
+        # Byte totals of the tasks currently downloading
+        self.bytes_downloaded = 0
+        self.bytes_total = 0
+        # Queued and downloading tasks, in the order they became active
+        self.active: Dict["DownloadTask", None] = {}
+
+    def add(self, task: "DownloadTask") -> None:
+        """Start counting a task."""
+        self.transition(task, None, task.status)
+
+    def remove(self, task: "DownloadTask") -> None:
+        """Stop counting a task."""
+        self.transition(task, task.status, None)
+
+    def transition(
+        self, task: "DownloadTask", old: Optional[str], new: Optional[str]
+    ) -> None:
+        """Move a task's contribution from its old status to its new one."""
+        if old == new:
+            return
+        if old in _STATUS_COUNTERS:
+            setattr(self, old, getattr(self, old) - 1)
+        if new in _STATUS_COUNTERS:
+            setattr(self, new, getattr(self, new) + 1)
+
+        if old == "downloading":
+            self.bytes_downloaded -= task.downloaded_bytes
+            self.bytes_total -= task.total_bytes
+        elif new == "downloading":
+            self.bytes_downloaded += task.downloaded_bytes
+            self.bytes_total += task.total_bytes
+
+        if new in _ACTIVE_STATUSES:
+            self.active.setdefault(task)
+        else:
+            self.active.pop(task, None)
+
+
+class RetryGuard:
+    """Stops retrying for a cool-down while most recent fetch attempts are failing."""
+
+    __slots__ = ("outcomes", "failure_rate", "cooldown_ns", "blocked_until")
+
+    def __init__(self, window: int, failure_rate: float, cooldown: float):
+        # True for a successful attempt, False for a failed one; newest last
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.failure_rate = failure_rate
+        self.cooldown_ns = int(cooldown * 1_000_000_000)
+        self.blocked_until = 0
+
+    def record_result(self, ok: bool) -> None:
+        """Record the outcome of one attempt."""
+        self.outcomes.append(ok)
+
+    def should_retry(self) -> bool:
+        """Whether a failed attempt may be retried right now."""
+        now = time.monotonic_ns()
+        if now < self.blocked_until:
+            return False
+        # Only judge a full window, so a couple of early failures don't trip it
+        if len(self.outcomes) == self.outcomes.maxlen:
+            failures = self.outcomes.count(False)
+            if failures > self.failure_rate * len(self.outcomes):
+                self.blocked_until = now + self.cooldown_ns
+                self.outcomes.clear()
+                return False
+        return True
+
+
 class DownloadTask:
     """Represents a download task with progress tracking."""
 
-    def __init__(
-        self, user_id: str, file_message, save_path: str, progress_message=None
-    ):
+    __slots__ = (
+        "user_id",
+        "file_message",
+        "save_path",
+        "basename",
+        "start_time",
+        "_downloaded_bytes",
+        "_total_bytes",
+        "_status",
+        "stats",
+        "error",
+        "total_mb_str",
+        "completed_at",
+    )
+
+    def __init__(self, user_id: str, file_message, save_path: str):
         self.user_id = user_id
         self.file_message = file_message
         self.save_path = save_path
-        self.progress_message = progress_message
-        self.start_time = time.time()
-        self.downloaded_bytes = 0
-        self.total_bytes = 0
-        self.status = "queued"  # queued, downloading, completed, failed
+        # Display name, computed once instead of on every status render
+        self.basename = os.path.basename(save_path)
+        self.start_time = time.monotonic()
+        # Counters of the owning user, attached when the task is queued
+        self.stats: Optional[UserDownloadStats] = None
+        self._downloaded_bytes = 0
+        self._total_bytes = 0
+        self._status = "queued"  # queued, downloading, completed, failed
         self.error: Optional[str] = None
-        self.last_progress_update: float = 0.0
-        self.progress_lock = threading.Lock()
+        # Formatted total size, cached once the size is known
+        self.total_mb_str: Optional[str] = None
+        self.completed_at: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, value: str) -> None:
+        if self.stats is not None:
+            self.stats.transition(self, self._status, value)
+        self._status = value
+
+    @property
+    def downloaded_bytes(self) -> int:
+        return self._downloaded_bytes
+
+    @downloaded_bytes.setter
+    def downloaded_bytes(self, value: int) -> None:
+        if self.stats is not None and self._status == "downloading":
+            self.stats.bytes_downloaded += value - self._downloaded_bytes
+        self._downloaded_bytes = value
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    @total_bytes.setter
+    def total_bytes(self, value: int) -> None:
+        if self.stats is not None and self._status == "downloading":
+            self.stats.bytes_total += value - self._total_bytes
+        self._total_bytes = value
+
+
+# Per-task lines of status and progress messages, formatted on every refresh
+QUEUED_DOWNLOAD_TEMPLATE = "{index}. ⏳ **{name}** - Waiting in queue\n"
+ACTIVE_DOWNLOAD_TEMPLATE = (
+    "{index}. 📥 **{name}**\n"
+    "   Progress: {progress:.1f}%\n"
+    "   Speed: {speed:.1f} MB/s\n"
+    "   Downloaded: {downloaded:.1f} MB / {total} MB\n"
+    "   ETA: {eta:.1f} min\n\n"
+)
+
+# Final text of a user's aggregated progress message once nothing is active
+DOWNLOADS_FINISHED_TEXT = "✅ **All downloads finished.**\n\nUse /status for details."
+
+# Notifications sent when a download finishes
+COMPLETE_NOTIFICATION_TEMPLATE = (
+    "🎉 **Download Complete!**\n\n"
+    "📁 **File:** {name}\n"
+    "📂 **Location:** {path}\n"
+    "⏱️ **Time:** {time:.1f} seconds\n"
+    "🚀 **Avg Speed:** {speed:.1f} MB/s\n"
+    "📊 **Size:** {size:.1f} MB"
+)
+FAILED_NOTIFICATION_TEMPLATE = (
+    "❌ **Download {outcome}!**\n\n"
+    "📁 **File:** {name}\n"
+    "🔍 **Error:** {error}\n\n"
+    "Use /status to retry failed downloads."
+)
+
+
+def format_download_entry(index: int, task: DownloadTask, now: float) -> str:
+    """Render one queued or downloading task; tasks in other states render as ''."""
+    status = task.status
+    if status == "queued":
+        return QUEUED_DOWNLOAD_TEMPLATE.format(index=index, name=task.basename)
+    if status != "downloading":
+        return ""
+    # Snapshot the byte counts once, so every figure uses the same values
+    downloaded = task.downloaded_bytes
+    total = task.total_bytes
+    progress = (downloaded / total * 100) if total > 0 else 0
+    elapsed_time = now - task.start_time
+    speed = downloaded / elapsed_time if elapsed_time > 0 else 0
+    eta_seconds = (total - downloaded) / speed if speed > 0 else 0
+    if task.total_mb_str is None and total > 0:
+        task.total_mb_str = f"{total * INV_MB:.1f}"
+
+    return ACTIVE_DOWNLOAD_TEMPLATE.format(
+        index=index,
+        name=task.basename,
+        progress=progress,
+        speed=speed * INV_MB,
+        downloaded=downloaded * INV_MB,
+        total=task.total_mb_str or "0.0",
+        eta=eta_seconds / 60,
+    )
+
+
+def format_active_downloads(
+    active_downloads: Collection[DownloadTask], limit: int = 5
+) -> str:
+    """Render queued and downloading tasks for status and progress messages."""
+    now = time.monotonic()
+    # Only the shown tasks are visited, so callers can pass the live active set
+    parts = [
+        format_download_entry(i, task, now)
+        for i, task in enumerate(islice(active_downloads, limit), 1)
+    ]
+
+    if len(active_downloads) > limit:
+        parts.append(f"... and {len(active_downloads) - limit} more downloads\n")
+
+    return "".join(parts)
 
 
 class DownloadManager:
     """Manages download queue and progress tracking."""
 
     def __init__(self):
-        self.download_queue: Dict[str, List[DownloadTask]] = {}
+        self.download_queue: Dict[str, Deque[DownloadTask]] = defaultdict(deque)
         self.download_progress: Dict[str, dict] = {}
-        self.download_executor = ThreadPoolExecutor(
-            max_workers=config.max_concurrent_downloads
-        )
+        # Per-user status counters, so status views need not rescan the queue
+        self.user_stats: Dict[str, UserDownloadStats] = {}
+
+        # Pending downloads drained by a bounded pool of worker coroutines
+        self.pending_downloads: asyncio.Queue = asyncio.Queue()
+        self.download_workers: List[asyncio.Task] = []
+        # Workers currently running a download, as opposed to about to take one
+        self.busy_workers = 0
+
+        # One aggregated progress message per user, edited by a single refresher
+        # task instead of each download editing its own message
+        self.progress_messages: Dict[str, Optional[Message]] = {}
+        # Last text sent per user, so unchanged progress is not edited again
+        self.progress_texts: Dict[str, str] = {}
+        # time.monotonic() before which a user's edits wait out a flood wait
+        self.progress_resume_at: Dict[str, float] = {}
+        self.progress_refresher: Optional[asyncio.Task] = None
+
+        # Drops completed downloads once they are older than completed_download_ttl
+        self.completed_purger: Optional[asyncio.Task] = None
 
         # Rate limiting for notifications
-        self.notification_cooldowns: Dict[str, float] = {}
+        # user_id -> time.monotonic_ns() deadline, oldest first
+        self.notification_cooldowns: "OrderedDict[str, int]" = OrderedDict()
+        # Notifications held back by a cooldown, sent together once it ends
+        self.pending_notifications: Dict[str, List[str]] = {}
+        self.notification_senders: Dict[str, asyncio.Task] = {}
 
-    async def update_progress_message(
-        self, task: DownloadTask, progress_text: str
-    ) -> None:
-        """Update the progress message in Telegram with throttling and better error handling."""
+        # Bytes per download request: halved after failed fetches, doubled back
+        # towards download_chunk_size after chunk_growth_successes clean ones
+        self.request_size = config.download_chunk_size
+        self.request_successes = 0
+
+        # Shared by all workers, so a failing data center is not hammered with retries
+        self.retry_guard = RetryGuard(
+            config.retry_guard_window,
+            config.retry_guard_failure_rate,
+            config.retry_guard_cooldown,
+        )
+
+    async def stop(self) -> None:
+        """Cancel the background tasks, for shutdown; downloads in progress are abandoned."""
+        tasks = [
+            task
+            for task in (
+                self.completed_purger,
+                self.progress_refresher,
+                *self.notification_senders.values(),
+                *self.download_workers,
+            )
+            if task is not None and not task.done()
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.completed_purger = None
+        self.progress_refresher = None
+        self.download_workers = []
+
+    async def edit_message(self, message: Message, text: str) -> None:
+        """Edit a message the bot sent, straight to its chat's input peer when known."""
+        # The peer comes from the message itself, so edits land in the chat the
+        # message was sent to even after the user moves on to another chat
+        input_peer = message.input_chat
+        if input_peer is not None:
+            # Edit straight to the peer, skipping the entity resolution in
+            # Message.edit; markdown is still parsed into entities for bold names
+            client = bot_client.client
+
+            text, entities = markdown.parse(text)
+            await client(
+                EditMessageRequest(
+                    peer=input_peer,
+                    id=message.id,
+                    message=text,
+                    entities=entities or None,
+                )
+            )
+        else:
+            await message.edit(text)
+
+    def track_progress(self, user_id: str) -> None:
+        """Include a user in the aggregated progress updates."""
+        self.progress_messages.setdefault(user_id, None)
+        if self.progress_refresher is None or self.progress_refresher.done():
+            self.progress_refresher = asyncio.create_task(
+                self.refresh_progress_messages()
+            )
+
+    async def refresh_progress_messages(self) -> None:
+        """Edit each tracked user's progress message once per interval until none remain."""
+        while self.progress_messages:
+            await asyncio.sleep(config.progress_update_interval)
+            # Users' edits go out together, so one slow edit does not delay the rest;
+            # update_user_progress handles its own errors
+            await asyncio.gather(
+                *(
+                    self.update_user_progress(user_id)
+                    for user_id in list(self.progress_messages)
+                )
+            )
+
+    async def update_user_progress(self, user_id: str) -> None:
+        """Send or edit the aggregated progress message for a user's active downloads."""
+        if time.monotonic() < self.progress_resume_at.get(user_id, 0.0):
+            # Still inside a flood wait; a later refresher tick sends the edit instead
+            return
+        active_downloads = self.get_user_stats(user_id).active
+        message = self.progress_messages.get(user_id)
+        if not active_downloads:
+            if message is None:
+                self.forget_user_progress(user_id)
+                return
+            # Nothing left to report; the message is closed out instead of
+            # staying at its last percentage
+            progress_text = DOWNLOADS_FINISHED_TEXT
+        else:
+            progress_text = "📥 **Active Downloads:**\n\n" + format_active_downloads(
+                active_downloads
+            )
+            if progress_text == self.progress_texts.get(user_id):
+                # Telegram would reject the edit as not modified
+                return
         try:
-            current_time = time.time()
-            # Only update if enough time has passed since last update
-            if (
-                current_time - task.last_progress_update
-                >= config.progress_update_interval
-            ):
-                if task.progress_message:
-                    await task.progress_message.edit(progress_text)
-                    task.last_progress_update = current_time
+            if message is None:
+                chat_id = user_state.get_chat_id(user_id)
+                if not chat_id:
+                    return
+                client = bot_client.client
+
+                self.progress_messages[user_id] = await client.send_message(
+                    chat_id, progress_text
+                )
+            else:
+                await self.edit_message(message, progress_text)
+            if active_downloads:
+                self.progress_texts[user_id] = progress_text
         except MessageNotModifiedError:
             # Message content is the same, ignore this error
             pass
+        except FloodWaitError as e:
+            logger.warning(f"Rate limit hit for progress updates. Error: {e}")
+            # Skip the user's edits for the full wait; the user stays tracked, so
+            # a final edit is sent once the wait is over rather than dropped
+            self.progress_resume_at[user_id] = time.monotonic() + e.seconds
+            return
         except Exception as e:
-            error_msg = str(e)
-            if "wait of" in error_msg and "seconds is required" in error_msg:
-                # Rate limit error - extract wait time and log it
-                logger.warning(
-                    f"Rate limit hit for progress updates. Error: {error_msg}"
-                )
-                # Don't update last_progress_update to prevent immediate retry
-            else:
-                logger.error(f"Failed to update progress message: {e}")
+            logger.error(f"Failed to update progress message: {e}")
+        if not active_downloads:
+            # The next download starts a fresh message
+            self.forget_user_progress(user_id)
+
+    def forget_user_progress(self, user_id: str) -> None:
+        """Stop tracking a user's aggregated progress message."""
+        self.progress_messages.pop(user_id, None)
+        self.progress_texts.pop(user_id, None)
+        self.progress_resume_at.pop(user_id, None)
 
     async def send_rate_limited_notification(self, user_id: str, message: str) -> None:
-        """Send a notification to user with rate limiting to prevent flood wait."""
+        """Send a notification, deferring it into a batched message during the user's cooldown."""
         try:
-            current_time = time.time()
-            last_notification = self.notification_cooldowns.get(user_id, 0)
+            now = time.monotonic_ns()
 
-            # Check if enough time has passed since last notification
-            if current_time - last_notification < config.notification_cooldown:
-                logger.info(f"Rate limiting notification for user {user_id}")
+            # Queue behind the cooldown, or behind notifications already waiting
+            if (
+                now < self.notification_cooldowns.get(user_id, 0)
+                or user_id in self.pending_notifications
+            ):
+                self.pending_notifications.setdefault(user_id, []).append(message)
+                sender = self.notification_senders.get(user_id)
+                if sender is None or sender.done():
+                    self.notification_senders[user_id] = asyncio.create_task(
+                        self.flush_notifications(user_id)
+                    )
+                logger.info(f"Deferring notification for user {user_id}")
                 return
 
-            chat_id = user_state.get_chat_id(user_id)
-            if chat_id:
-                from ..bot.client import client
-
-                await client.send_message(chat_id, message)
-                self.notification_cooldowns[user_id] = current_time
-                logger.info(f"Sent notification to user {user_id}")
+            await self.deliver_notification(user_id, message)
         except Exception as e:
             logger.error(f"Failed to send notification to user {user_id}: {e}")
 
+    async def deliver_notification(self, user_id: str, message: str) -> None:
+        """Send a notification now and start the user's cooldown."""
+        chat_id = user_state.get_chat_id(user_id)
+        if chat_id:
+            client = bot_client.client
+
+            await client.send_message(chat_id, message)
+            self.notification_cooldowns[user_id] = time.monotonic_ns() + int(
+                config.notification_cooldown * 1_000_000_000
+            )
+            self.notification_cooldowns.move_to_end(user_id)
+            if len(self.notification_cooldowns) > MAX_NOTIFICATION_COOLDOWNS:
+                self.notification_cooldowns.popitem(last=False)
+            logger.info(f"Sent notification to user {user_id}")
+
+    async def flush_notifications(self, user_id: str) -> None:
+        """Send a user's deferred notifications, one batched message per cooldown."""
+        try:
+            while user_id in self.pending_notifications:
+                delay_ns = (
+                    self.notification_cooldowns.get(user_id, 0) - time.monotonic_ns()
+                )
+                if delay_ns > 0:
+                    await asyncio.sleep(delay_ns / 1_000_000_000)
+
+                # Take as many waiting messages as fit into one Telegram message
+                messages = self.pending_notifications[user_id]
+                count = 1
+                length = len(messages[0])
+                while (
+                    count < len(messages)
+                    and length + 2 + len(messages[count]) <= MAX_MESSAGE_LENGTH
+                ):
+                    length += 2 + len(messages[count])
+                    count += 1
+                batch = messages[:count]
+                del messages[:count]
+                if not messages:
+                    del self.pending_notifications[user_id]
+
+                await self.deliver_notification(user_id, "\n\n".join(batch))
+        except Exception as e:
+            self.pending_notifications.pop(user_id, None)
+            logger.error(
+                f"Failed to send deferred notifications to user {user_id}: {e}"
+            )
+        finally:
+            self.notification_senders.pop(user_id, None)
+
     async def send_notification(
         self, user_id: str, message: str, is_management_command: bool = False
     ) -> None:
@@ -111,7 +584,7 @@ class DownloadManager:
             if is_management_command:
                 chat_id = user_state.get_chat_id(user_id)
                 if chat_id:
-                    from ..bot.client import client
+                    client = bot_client.client
 
                     await client.send_message(chat_id, message)
                     logger.info(f"Sent management notification to user {user_id}")
@@ -121,107 +594,261 @@ class DownloadManager:
         except Exception as e:
             logger.error(f"Failed to send notification to user {user_id}: {e}")
 
-    async def download_with_progress(self, task: DownloadTask) -> None:
-        """Download file with optimized progress tracking."""
+    async def stream_to_file(
+        self, task: DownloadTask, progress_callback: Callable[[int, int], None]
+    ) -> str:
+        """Stream media into task.save_path, flushing batches of chunks to disk off the event loop."""
+        client = bot_client.client
+
+        request_size = self.request_size
+        fd = await asyncio.to_thread(
+            _open_for_download, task.save_path, task.total_bytes
+        )
+        # Chunks must pass through user space: MTProto encrypts every payload, so
+        # socket bytes never equal file bytes and os.splice/os.sendfile cannot be
+        # used. Copying into the pooled batch buffer is the only copy made here.
+        buffer = acquire_buffer()
+        view = memoryview(buffer)
+        # Loop invariants are bound once, so each chunk only touches locals
+        capacity = len(buffer)
         try:
-            task.status = "downloading"
+            filled = 0
+            received_bytes = 0
+            async for chunk in client.iter_download(
+                task.file_message.media, request_size=request_size
+            ):
+                size = len(chunk)
+                if filled + size > capacity:
+                    # Batch is full, flush it with a single write
+                    await asyncio.to_thread(_write_all, fd, view[:filled])
+                    filled = 0
+                if size > capacity:
+                    await asyncio.to_thread(_write_all, fd, memoryview(chunk))
+                else:
+                    view[filled : filled + size] = chunk
+                    filled += size
+                received_bytes += size
+                progress_callback(received_bytes, task.total_bytes)
+            if filled:
+                await asyncio.to_thread(_write_all, fd, view[:filled])
+        finally:
+            view.release()
+            release_buffer(buffer)
+            await asyncio.to_thread(os.close, fd)
+        return task.save_path
 
-            # Get file size
-            if (
-                hasattr(task.file_message.media, "document")
-                and task.file_message.media.document
+    async def fetch_range(
+        self,
+        task: DownloadTask,
+        fd: int,
+        request_size: int,
+        first_chunk: int,
+        chunk_count: int,
+        on_chunk: Callable[[int], None],
+    ) -> None:
+        """Fetch a run of chunks and write them at their file offset in pooled batches."""
+        client = bot_client.client
+
+        offset = first_chunk * request_size
+        buffer = acquire_buffer()
+        view = memoryview(buffer)
+        capacity = len(buffer)
+        try:
+            filled = 0
+            async for chunk in client.iter_download(
+                task.file_message.media,
+                offset=offset,
+                limit=chunk_count,
+                request_size=request_size,
             ):
-                task.total_bytes = task.file_message.media.document.size
+                size = len(chunk)
+                if filled + size > capacity:
+                    await asyncio.to_thread(_pwrite_all, fd, view[:filled], offset)
+                    offset += filled
+                    filled = 0
+                view[filled : filled + size] = chunk
+                filled += size
+                on_chunk(size)
+            if filled:
+                await asyncio.to_thread(_pwrite_all, fd, view[:filled], offset)
+        finally:
+            view.release()
+            release_buffer(buffer)
+
+    async def stream_parts_to_file(
+        self, task: DownloadTask, progress_callback: Callable[[int, int], None]
+    ) -> str:
+        """Fetch contiguous ranges of a large document concurrently into task.save_path."""
+        request_size = self.request_size
+        chunk_total = -(-task.total_bytes // request_size)
+        part_chunks = -(-chunk_total // config.parallel_parts)
+        received_bytes = 0
+
+        def on_chunk(size: int) -> None:
+            nonlocal received_bytes
+            received_bytes += size
+            progress_callback(received_bytes, task.total_bytes)
+
+        fd = await asyncio.to_thread(
+            _open_for_download, task.save_path, task.total_bytes
+        )
+        parts = [
+            asyncio.create_task(
+                self.fetch_range(
+                    task,
+                    fd,
+                    request_size,
+                    first,
+                    min(part_chunks, chunk_total - first),
+                    on_chunk,
+                )
+            )
+            for first in range(0, chunk_total, part_chunks)
+        ]
+        try:
+            await asyncio.gather(*parts)
+        finally:
+            # A failed part must not leave siblings writing to a closed descriptor
+            for part in parts:
+                part.cancel()
+            await asyncio.gather(*parts, return_exceptions=True)
+            await asyncio.to_thread(os.close, fd)
+        return task.save_path
+
+    async def fetch_media(
+        self, task: DownloadTask, progress_callback: Callable[[int, int], None]
+    ) -> Optional[str]:
+        """Download the task's media to its save path."""
+        client = bot_client.client
+
+        # Large documents are fetched as concurrent byte ranges, other documents
+        # and photos are streamed with batched disk writes, and any remaining
+        # media types fall back to Telethon's own downloader
+        if (
+            isinstance(task.file_message.media, MessageMediaDocument)
+            and config.parallel_parts > 1
+            and hasattr(os, "pwrite")
+            and task.total_bytes > self.request_size * config.parallel_parts
+        ):
+            return await self.stream_parts_to_file(task, progress_callback)
+        if isinstance(
+            task.file_message.media, (MessageMediaDocument, MessageMediaPhoto)
+        ):
+            return await self.stream_to_file(task, progress_callback)
+        return await client.download_media(
+            task.file_message.media,
+            task.save_path,
+            progress_callback=progress_callback,
+        )
+
+    async def fetch_with_backoff(
+        self, task: DownloadTask, progress_callback: Callable[[int, int], None]
+    ) -> Optional[str]:
+        """Fetch media, retrying flood waits and dropped connections with backoff."""
+        attempt = 0
+        reference_refreshed = False
+        while True:
+            try:
+                downloaded_file = await self.fetch_media(task, progress_callback)
+            except FileReferenceExpiredError:
+                # Old messages' file references expire; a re-fetched copy carries a
+                # fresh one. Only once per fetch, so a stale reply cannot loop forever.
+                if reference_refreshed or not await self.refresh_file_message(task):
+                    raise
+                reference_refreshed = True
+                logger.info(
+                    f"Refreshed the file reference of {task.basename}, restarting its download"
+                )
+            except (FloodWaitError, ConnectionError, TimeoutError) as e:
+                self.retry_guard.record_result(False)
+                self.shrink_request_size()
+                if (
+                    attempt >= config.download_retries
+                    or not self.retry_guard.should_retry()
+                ):
+                    raise
+                delay = backoff_delay(attempt)
+                if isinstance(e, FloodWaitError):
+                    delay += e.seconds
+                attempt += 1
+                logger.warning(
+                    f"Download of {task.basename} interrupted ({e}), "
+                    f"retry {attempt}/{config.download_retries} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
             else:
-                task.total_bytes = 0
-
-            # Get chat_id from user_states
-            chat_id = user_state.get_chat_id(task.user_id)
-            logger.info(f"Download task for user {task.user_id}, chat_id: {chat_id}")
-            if not chat_id:
-                logger.error(f"No chat_id found for user {task.user_id}")
-                # Try to get chat_id from the file message
-                try:
-                    chat_id = task.file_message.chat_id
-                    logger.info(f"Using chat_id from file message: {chat_id}")
-                except Exception as e:
-                    logger.error(f"Could not get chat_id from file message: {e}")
-                    return
+                self.retry_guard.record_result(True)
+                self.grow_request_size()
+                return downloaded_file
+
+    async def refresh_file_message(self, task: DownloadTask) -> bool:
+        """Re-fetch a task's message for a fresh file reference; False if it is gone."""
+        client = bot_client.client
+
+        message = await client.get_messages(
+            task.file_message.chat_id, ids=task.file_message.id
+        )
+        if message is None or message.media is None:
+            return False
+        task.file_message = message
+        return True
+
+    def shrink_request_size(self) -> None:
+        """Halve the download request size after a failed fetch."""
+        self.request_size = max(config.min_download_chunk_size, self.request_size // 2)
+        self.request_successes = 0
+
+    def grow_request_size(self) -> None:
+        """Double the request size again once enough fetches in a row succeed."""
+        self.request_successes += 1
+        if self.request_successes >= config.chunk_growth_successes:
+            self.request_size = min(config.download_chunk_size, self.request_size * 2)
+            self.request_successes = 0
+
+    async def download_with_progress(self, task: DownloadTask) -> None:
+        """Download file with optimized progress tracking."""
+        try:
+            task.status = "downloading"
+            # Time spent waiting in the queue does not count towards speed
+            task.start_time = time.monotonic()
 
-            # Create progress message
-            progress_text = f"📥 Starting download...\nFile: {os.path.basename(task.save_path)}\nSize: {task.total_bytes / (1024 * 1024):.1f} MB"
-            from ..bot.client import client
+            # Get file size once; the progress callback compares against this local
+            document = getattr(task.file_message.media, "document", None)
+            known_total = document.size if document else 0
+            task.total_bytes = known_total
 
-            task.progress_message = await client.send_message(chat_id, progress_text)
+            # Progress is shown in the user's aggregated message rather than a
+            # message per download; completion and failure are notifications
+            self.track_progress(task.user_id)
 
-            # Optimized progress callback with throttling
             def progress_callback(received_bytes, total_bytes):
-                with task.progress_lock:
-                    task.downloaded_bytes = received_bytes
-                    task.total_bytes = total_bytes
-
-                    # Calculate progress
-                    if total_bytes > 0:
-                        progress_percent = (received_bytes / total_bytes) * 100
-                        elapsed_time = time.time() - task.start_time
-                        speed = received_bytes / elapsed_time if elapsed_time > 0 else 0
-
-                        # Only update progress message periodically to reduce overhead
-                        current_time = time.time()
-                        if (
-                            current_time - task.last_progress_update
-                            >= config.progress_update_interval
-                        ):
-                            progress_text = (
-                                f"📥 Downloading...\n"
-                                f"File: {os.path.basename(task.save_path)}\n"
-                                f"Progress: {progress_percent:.1f}%\n"
-                                f"Speed: {speed / (1024 * 1024):.1f} MB/s\n"
-                                f"Downloaded: {received_bytes / (1024 * 1024):.1f} MB / {total_bytes / (1024 * 1024):.1f} MB\n"
-                                f"ETA: {((total_bytes - received_bytes) / speed / 60):.1f} min"
-                                if speed > 0
-                                else "Calculating..."
-                            )
-
-                            # Update progress message (non-blocking)
-                            asyncio.create_task(
-                                self.update_progress_message(task, progress_text)
-                            )
-
-            # Download with optimized settings
-            downloaded_file = await client.download_media(
-                task.file_message.media,
-                task.save_path,
-                progress_callback=progress_callback,
-            )
+                # Only record progress; the progress refresher renders it. The
+                # total is checked against a closure local and stored only when
+                # a late-arriving size differs, not on every chunk.
+                nonlocal known_total
+                task.downloaded_bytes = received_bytes
+                if total_bytes != known_total:
+                    known_total = task.total_bytes = total_bytes
+
+            downloaded_file = await self.fetch_with_backoff(task, progress_callback)
 
             if downloaded_file:
                 task.status = "completed"
-                total_time = time.time() - task.start_time
+                task.completed_at = time.monotonic()
+                total_time = task.completed_at - task.start_time
                 avg_speed = task.total_bytes / total_time if total_time > 0 else 0
 
-                completion_text = (
-                    f"✅ Download completed!\n"
-                    f"File: {os.path.basename(task.save_path)}\n"
-                    f"Path: {downloaded_file}\n"
-                    f"Time: {total_time:.1f}s\n"
-                    f"Avg Speed: {avg_speed / (1024 * 1024):.1f} MB/s"
-                )
-                await self.update_progress_message(task, completion_text)
-
-                # Send completion notification to user
+                # Send completion notification to user; send_notification skips
+                # users without a chat id, so no lookup is repeated here
                 try:
-                    chat_id = user_state.get_chat_id(task.user_id)
-                    if chat_id:
-                        notification_text = (
-                            f"🎉 **Download Complete!**\n\n"
-                            f"📁 **File:** {os.path.basename(task.save_path)}\n"
-                            f"📂 **Location:** {downloaded_file}\n"
-                            f"⏱️ **Time:** {total_time:.1f} seconds\n"
-                            f"🚀 **Avg Speed:** {avg_speed / (1024 * 1024):.1f} MB/s\n"
-                            f"📊 **Size:** {task.total_bytes / (1024 * 1024):.1f} MB"
-                        )
-                        await self.send_notification(task.user_id, notification_text)
+                    notification_text = COMPLETE_NOTIFICATION_TEMPLATE.format(
+                        name=task.basename,
+                        path=downloaded_file,
+                        time=total_time,
+                        speed=avg_speed / MB,
+                        size=task.total_bytes / MB,
+                    )
+                    await self.send_notification(task.user_id, notification_text)
                 except Exception as e:
                     logger.error(f"Failed to send completion notification: {e}")
 
@@ -231,21 +858,13 @@ class DownloadManager:
             else:
                 task.status = "failed"
                 task.error = "Download failed"
-                await self.update_progress_message(
-                    task, f"❌ Download failed: {os.path.basename(task.save_path)}"
-                )
 
                 # Send failure notification to user
                 try:
-                    chat_id = user_state.get_chat_id(task.user_id)
-                    if chat_id:
-                        notification_text = (
-                            f"❌ **Download Failed!**\n\n"
-                            f"📁 **File:** {os.path.basename(task.save_path)}\n"
-                            f"🔍 **Error:** Download failed\n\n"
-                            f"Use /status to retry failed downloads."
-                        )
-                        await self.send_notification(task.user_id, notification_text)
+                    notification_text = FAILED_NOTIFICATION_TEMPLATE.format(
+                        outcome="Failed", name=task.basename, error=task.error
+                    )
+                    await self.send_notification(task.user_id, notification_text)
                 except Exception as e:
                     logger.error(f"Failed to send failure notification: {e}")
 
@@ -254,20 +873,13 @@ class DownloadManager:
         except Exception as e:
             task.status = "failed"
             task.error = str(e)
-            error_text = f"❌ Download error: {os.path.basename(task.save_path)}\nError: {str(e)}"
-            await self.update_progress_message(task, error_text)
 
             # Send error notification to user
             try:
-                chat_id = user_state.get_chat_id(task.user_id)
-                if chat_id:
-                    notification_text = (
-                        f"❌ **Download Error!**\n\n"
-                        f"📁 **File:** {os.path.basename(task.save_path)}\n"
-                        f"🔍 **Error:** {str(e)}\n\n"
-                        f"Use /status to retry failed downloads."
-                    )
-                    await self.send_notification(task.user_id, notification_text)
+                notification_text = FAILED_NOTIFICATION_TEMPLATE.format(
+                    outcome="Error", name=task.basename, error=task.error
+                )
+                await self.send_notification(task.user_id, notification_text)
             except Exception as notify_e:
                 logger.error(f"Failed to send error notification: {notify_e}")
 
@@ -276,52 +888,143 @@ class DownloadManager:
     async def queue_download(
         self, user_id: str, file_message, save_path: str
     ) -> DownloadTask:
-        """Add download to queue and start if possible with optimized concurrency."""
+        """Add a download to the queue; the worker pool bounds how many run at once."""
         logger.info(f"Queueing download for user {user_id} to path: {save_path}")
         logger.info(
             f"User state chat_id for {user_id}: {user_state.get_chat_id(user_id)}"
         )
 
         task = DownloadTask(user_id, file_message, save_path)
-        self.download_queue[user_id] = self.download_queue.get(user_id, []) + [task]
+        task.stats = self.get_user_stats(user_id)
+        task.stats.add(task)
+        self.download_queue[user_id].append(task)
+        self.start_completed_purger()
 
-        # Start download in background with optimized executor
-        asyncio.create_task(self.download_with_progress(task))
+        # Hand the download to the worker pool, which bounds concurrency
+        self.pending_downloads.put_nowait(task)
+        self.start_download_workers()
 
         return task
 
-    def get_user_downloads(self, user_id: str) -> List[DownloadTask]:
+    def start_download_workers(self) -> None:
+        """Top up the worker pool for pending downloads, up to the concurrency limit."""
+        self.download_workers = [
+            worker for worker in self.download_workers if not worker.done()
+        ]
+        # Busy workers cannot take pending downloads, so they count on top of them
+        while len(self.download_workers) < min(
+            config.max_concurrent_downloads,
+            self.busy_workers + self.pending_downloads.qsize(),
+        ):
+            self.download_workers.append(asyncio.create_task(self.download_worker()))
+
+    async def download_worker(self) -> None:
+        """Download queued tasks one at a time, exiting once the queue is empty."""
+        while True:
+            try:
+                task = self.pending_downloads.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            self.busy_workers += 1
+            try:
+                await self.download_with_progress(task)
+            except Exception as e:
+                logger.error(f"Download worker error: {e}")
+            finally:
+                self.busy_workers -= 1
+                self.pending_downloads.task_done()
+
+    def get_user_downloads(self, user_id: str) -> Sequence[DownloadTask]:
         """Get all downloads for a user."""
         return self.download_queue.get(user_id, [])
 
+    def get_user_stats(self, user_id: str) -> UserDownloadStats:
+        """Get the status counters for a user's downloads."""
+        stats = self.user_stats.get(user_id)
+        if stats is None:
+            stats = self.user_stats[user_id] = UserDownloadStats()
+        return stats
+
     def clear_completed_downloads(self, user_id: str) -> int:
         """Remove completed downloads from queue and return count of cleared downloads."""
-        user_downloads = self.download_queue.get(user_id, [])
-        if user_downloads:
-            # Keep only non-completed downloads
-            original_count = len(user_downloads)
-            self.download_queue[user_id] = [
-                task for task in user_downloads if task.status != "completed"
-            ]
-            cleared_count = original_count - len(self.download_queue[user_id])
-            return cleared_count
-        return 0
+        return self._remove_completed(user_id, float("inf"))
+
+    def _remove_completed(self, user_id: str, completed_before: float) -> int:
+        """Remove a user's downloads completed before a time and return how many were removed."""
+        user_downloads = self.download_queue.get(user_id)
+        if not user_downloads:
+            return 0
+        stats = self.user_stats.get(user_id)
+        if stats is not None and not stats.completed:
+            # Nothing to remove, so skip the scan and the rebuilt deque
+            return 0
+
+        # Keep only downloads that are not completed, or completed more recently
+        remaining = deque()
+        removed_count = 0
+        for task in user_downloads:
+            if (
+                task.status != "completed"
+                or (task.completed_at or 0.0) >= completed_before
+            ):
+                remaining.append(task)
+                continue
+            if task.stats is not None:
+                task.stats.remove(task)
+                task.stats = None
+            removed_count += 1
+        if removed_count:
+            self.download_queue[user_id] = remaining
+        return removed_count
+
+    def start_completed_purger(self) -> None:
+        """Start the background sweep of old completed downloads if it is not running."""
+        if self.completed_purger is None or self.completed_purger.done():
+            self.completed_purger = asyncio.create_task(
+                self.purge_completed_downloads()
+            )
+
+    async def purge_completed_downloads(self) -> None:
+        """Periodically drop completed downloads older than the TTL, until no downloads remain."""
+        while any(self.download_queue.values()):
+            await asyncio.sleep(COMPLETED_PURGE_INTERVAL)
+            cutoff = time.monotonic() - config.completed_download_ttl
+            for user_id in list(self.download_queue):
+                self._remove_completed(user_id, cutoff)
+                if not self.download_queue[user_id]:
+                    del self.download_queue[user_id]
+                    # Counters of a user with nothing queued are dropped too,
+                    # so per-user state stays bounded by the users with downloads
+                    stats = self.user_stats.get(user_id)
+                    if (
+                        stats is not None
+                        and not stats.active
+                        and not stats.completed
+                        and not stats.failed
+                    ):
+                        del self.user_stats[user_id]
 
     def retry_failed_downloads(self, user_id: str) -> int:
         """Retry all failed downloads for a user and return count of retried downloads."""
-        user_downloads = self.download_queue.get(user_id, [])
-        failed_tasks = [task for task in user_downloads if task.status == "failed"]
+        stats = self.user_stats.get(user_id)
+        if stats is not None and not stats.failed:
+            # Nothing failed, so skip the queue scan
+            return 0
 
         retry_count = 0
-        for task in failed_tasks:
-            # Reset task status and restart download
+        for task in self.download_queue.get(user_id, []):
+            if task.status != "failed":
+                continue
+            # Reset task status and hand it back to the worker pool
             task.status = "queued"
             task.downloaded_bytes = 0
             task.error = None
-            task.start_time = time.time()
+            task.start_time = time.monotonic()
             retry_count += 1
-            # Restart the download
-            asyncio.create_task(self.download_with_progress(task))
+            self.pending_downloads.put_nowait(task)
+
+        if retry_count:
+            self.start_download_workers()
 
         return retry_count
 
@@ -7,6 +7,7 @@ import os
 import time
 import asyncio
 import logging
+from functools import lru_cache
 from telethon import events, Button
 from telethon.errors import MessageNotModifiedError
 
@@ -18,75 +19,35 @@ from ..utils.keyboard_utils import (
     create_directory_keyboard, create_help_keyboard, create_rename_keyboard,
     create_status_keyboard, create_back_button
 )
-from ..downloads.download_manager import download_manager
+from ..downloads.download_manager import (
+    download_manager, format_active_downloads, format_download_entry
+)
 
 logger = logging.getLogger(__name__)
 
-@client.on(events.CallbackQuery())
-async def callback_handler(event):
-    """Handle button callbacks for directory selection and help."""
-    user_id = str(event.sender_id)
-    if not user_state.is_authorized(user_id, config.allowed_users):
-        return
-    
-    data = event.data.decode()
-    logger.info(f"User {user_id} clicked button: {data}")
-    
-    try:
-        if data.startswith('dir:'):
-            # Directory navigation
-            encoded_path = data[4:]  # Remove 'dir:' prefix
-            path = path_manager.decode_path(encoded_path)
-            buttons = await create_directory_keyboard(path)
-            await event.edit(
-                f"Select directory to save file:\nCurrent: {path}",
-                buttons=buttons
-            )
-        
-        elif data.startswith('select:'):
-            # Directory selected
-            encoded_path = data[7:]  # Remove 'select:' prefix
-            path = path_manager.decode_path(encoded_path)
-            user_state.set_user_data(user_id, 'selected_dir', path)
-            user_state.set_state(user_id, 'awaiting_filename')
-            
-            display_path = path if path else '.'
-            await event.edit(
-                f"Directory selected: {display_path}\n\n"
-                "Do you want to rename the file?",
-                buttons=create_rename_keyboard()
-            )
-        
-        elif data == 'skip_rename':
-            # Skip renaming, use original filename
-            logger.info(f"User {user_id} chose to skip renaming")
-            await download_file(event, user_id)
-        
-        elif data == 'rename_file':
-            # User wants to rename, ask for new filename
-            logger.info(f"User {user_id} chose to rename file")
-            user_state.set_state(user_id, 'awaiting_filename')
-            await event.edit(
-                "Please enter the new filename (including extension):"
-            )
-        
-        elif data.startswith('create_folder:'):
-            # Create new folder
-            encoded_path = data[14:]  # Remove 'create_folder:' prefix
-            path = path_manager.decode_path(encoded_path)
-            user_state.set_state(user_id, 'awaiting_folder_name')
-            user_state.set_user_data(user_id, 'create_folder_path', path)
-            
-            display_path = path if path else '.'
-            await event.edit(
-                f"Creating new folder in: {display_path}\n\n"
-                "Please enter the name for the new folder:",
-                buttons=[[Button.inline("⬅️ Cancel", f"dir:{encoded_path}")]]
-            )
-        
-        # Help section callbacks
-        elif data == 'help_commands':
-            help_text = """
+# Last status refresh time per user, used to debounce rapid button presses
+_last_refresh = {}
+
+HELP_MENU_TEXT = """
+🤖 **Telegram File Downloader Bot - Help Menu**
+
+Choose a category below to learn more about specific features:
+"""
+
+# Keyboards that never change, built once at import rather than per click
+REFRESH_BUTTONS = [[Button.inline("🔄 Refresh", "status_refresh")]]
+_STATUS_BACK_BUTTONS = create_back_button("status_refresh")
+_RENAME_BUTTONS = create_rename_keyboard()
+
+@lru_cache(maxsize=256)
+def _folder_cancel_buttons(encoded_path: str):
+    """Cancel keyboard for folder creation, reused for repeat visits to the same directory."""
+    return [[Button.inline("⬅️ Cancel", f"dir:{encoded_path}")]]
+
+# Static help pages keyed by callback suffix (help_<key>), built once at import
+_HELP_BACK_BUTTONS = create_back_button("help_back")
+HELP_TEXTS = {
+    'commands': ("""
 📋 **Available Commands:**
 
 • `/start` - Start the bot and begin file download process
@@ -94,12 +55,8 @@ async def callback_handler(event):
 • `/status` - Check the status of your current downloads
 
 Each command serves a specific purpose in the file download workflow.
-"""
-            buttons = create_back_button("help_back")
-            await event.edit(help_text, buttons=buttons)
-        
-        elif data == 'help_files':
-            help_text = """
+""", _HELP_BACK_BUTTONS),
+    'files': ("""
 📁 **File Operations:**
 
 • **Forward any file** (up to 2GB) to the bot
@@ -109,12 +66,8 @@ Each command serves a specific purpose in the file download workflow.
 • **Support for all file types**: documents, photos, videos, audio, voice messages
 
 The bot handles files of any type and size up to 2GB.
-"""
-            buttons = create_back_button("help_back")
-            await event.edit(help_text, buttons=buttons)
-        
-        elif data == 'help_navigation':
-            help_text = """
+""", _HELP_BACK_BUTTONS),
+    'navigation': ("""
 🔄 **Directory Navigation:**
 
 • **⬆️ Back** - Go to parent directory
@@ -123,12 +76,8 @@ The bot handles files of any type and size up to 2GB.
 • **📁 Folder names** - Click to navigate into directories
 
 You can navigate up to parent directories indefinitely and access any directory on your system.
-"""
-            buttons = create_back_button("help_back")
-            await event.edit(help_text, buttons=buttons)
-        
-        elif data == 'help_features':
-            help_text = """
+""", _HELP_BACK_BUTTONS),
+    'features': ("""
 ⚙️ **Bot Features:**
 
 • **Parallel downloads** - Multiple files download simultaneously
@@ -138,12 +87,8 @@ You can navigate up to parent directories indefinitely and access any directory
 • **User authentication** - Secure access control
 • **File type support** - All Telegram file types supported
 • **Directory navigation** - Full system directory access
-"""
-            buttons = create_back_button("help_back")
-            await event.edit(help_text, buttons=buttons)
-        
-        elif data == 'help_tips':
-            help_text = """
+""", _HELP_BACK_BUTTONS),
+    'tips': ("""
 💡 **Tips & Tricks:**
 
 • **Navigate freely** - You can go up parent directories indefinitely
@@ -152,12 +97,8 @@ You can navigate up to parent directories indefinitely and access any directory
 • **Speed optimization** - Bot uses optimized download settings
 • **Session persistence** - Login once, use multiple times
 • **Safe navigation** - System directories are filtered for safety
-"""
-            buttons = create_back_button("help_back")
-            await event.edit(help_text, buttons=buttons)
-        
-        elif data == 'help_quickstart':
-            help_text = """
+""", _HELP_BACK_BUTTONS),
+    'quickstart': ("""
 🚀 **Quick Start Guide:**
 
 1. **Start the bot** - Send `/start`
@@ -168,72 +109,139 @@ You can navigate up to parent directories indefinitely and access any directory
 6. **Download** - File downloads with progress updates
 
 That's it! Your file will be downloaded to the selected location.
-"""
-            buttons = create_back_button("help_back")
-            await event.edit(help_text, buttons=buttons)
-        
-        elif data == 'help_back':
-            # Return to main help menu
-            help_text = """
-🤖 **Telegram File Downloader Bot - Help Menu**
+""", _HELP_BACK_BUTTONS),
+    # Return to main help menu
+    'back': (HELP_MENU_TEXT, create_help_keyboard()),
+}
 
-Choose a category below to learn more about specific features:
-"""
-            buttons = create_help_keyboard()
-            await event.edit(help_text, buttons=buttons)
-        
-        # Status manager callbacks
-        elif data == 'status_refresh':
-            await handle_status_refresh(event, user_id)
-        
-        elif data == 'show_all_downloads':
-            await handle_show_all_downloads(event, user_id)
-        
-        elif data == 'clear_completed':
-            await handle_clear_completed(event, user_id)
-        
-        elif data == 'pause_all':
-            await event.answer("⏸️ Pause functionality coming soon!")
-        
-        elif data == 'resume_all':
-            await event.answer("▶️ Resume functionality coming soon!")
+@client.on(events.CallbackQuery())
+async def callback_handler(event):
+    """Handle button callbacks for directory selection and help."""
+    user_id = str(event.sender_id)
+    if not user_state.is_authorized(event.sender_id, config.allowed_users):
+        return
+    
+    data = event.data.decode()
+    logger.debug("User %s clicked button: %s", user_id, data)
+    
+    try:
+        handler = CALLBACK_HANDLERS.get(data)
+        if handler:
+            await handler(event, user_id)
+            return
         
-        elif data == 'retry_failed':
-            await handle_retry_failed(event, user_id)
+        for prefix, prefix_handler in PREFIX_CALLBACK_HANDLERS:
+            # removeprefix fuses the startswith check and slice into one call
+            if (payload := data.removeprefix(prefix)) != data:
+                await prefix_handler(event, user_id, payload)
+                break
     
     except MessageNotModifiedError:
         # Message content is the same, ignore this error
         pass
     except Exception as e:
-        logger.error(f"Error in callback handler: {e}")
+        logger.error("Error in callback handler: %s", e)
         error_msg = f"❌ **Bot Error!**\n\nAn error occurred while processing your request.\n\n**Error:** {str(e)}\n\nPlease try again or use /start to restart."
         await download_manager.send_notification(user_id, error_msg)
         await event.answer("An error occurred. Please try again.")
 
+async def handle_directory_navigation(event, user_id: str, encoded_path: str):
+    """Handle directory navigation callback."""
+    path = path_manager.decode_path(encoded_path)
+    buttons = await create_directory_keyboard(path)
+    await event.edit(
+        f"Select directory to save file:\nCurrent: {path}",
+        buttons=buttons
+    )
+
+async def handle_directory_selected(event, user_id: str, encoded_path: str):
+    """Handle directory selection callback."""
+    path = path_manager.decode_path(encoded_path)
+    user_state.set_user_data(user_id, 'selected_dir', path)
+    user_state.set_state(user_id, 'awaiting_filename')
+    
+    display_path = path if path else '.'
+    await event.edit(
+        f"Directory selected: {display_path}\n\n"
+        "Do you want to rename the file?",
+        buttons=_RENAME_BUTTONS
+    )
+
+async def handle_create_folder(event, user_id: str, encoded_path: str):
+    """Handle create new folder callback."""
+    path = path_manager.decode_path(encoded_path)
+    user_state.set_state(user_id, 'awaiting_folder_name')
+    user_state.set_user_data(user_id, 'create_folder_path', path)
+    
+    display_path = path if path else '.'
+    await event.edit(
+        f"Creating new folder in: {display_path}\n\n"
+        "Please enter the name for the new folder:",
+        buttons=_folder_cancel_buttons(encoded_path)
+    )
+
+async def handle_help_page(event, user_id: str, page: str):
+    """Handle help section callbacks."""
+    help_page = HELP_TEXTS.get(page)
+    if help_page:
+        help_text, buttons = help_page
+        await event.edit(help_text, buttons=buttons)
+
+async def handle_skip_rename(event, user_id: str):
+    """Handle skip rename callback, using the original filename."""
+    logger.debug("User %s chose to skip renaming", user_id)
+    await download_file(event, user_id)
+
+async def handle_rename_file(event, user_id: str):
+    """Handle rename callback, asking for a new filename."""
+    logger.debug("User %s chose to rename file", user_id)
+    user_state.set_state(user_id, 'awaiting_filename')
+    await event.edit(
+        "Please enter the new filename (including extension):"
+    )
+
+async def handle_pause_all(event, user_id: str):
+    """Handle pause all downloads callback."""
+    await event.answer("⏸️ Pause functionality coming soon!")
+
+async def handle_resume_all(event, user_id: str):
+    """Handle resume all downloads callback."""
+    await event.answer("▶️ Resume functionality coming soon!")
+
+async def _is_refresh_debounced(event, user_id: str) -> bool:
+    """Check whether a status action arrived too soon after the previous one."""
+    now = time.monotonic()
+    if now - _last_refresh.get(user_id, 0.0) < config.status_refresh_debounce:
+        await event.answer("Refreshing...")
+        return True
+    _last_refresh[user_id] = now
+    return False
+
 async def handle_status_refresh(event, user_id: str):
     """Handle status refresh callback."""
+    if await _is_refresh_debounced(event, user_id):
+        return
+    
     user_downloads = download_manager.get_user_downloads(user_id)
     if not user_downloads:
         await event.edit(
             "📊 **Download Manager**\n\n"
             "No downloads in queue.\n"
             "Forward a file to start downloading!",
-            buttons=[[Button.inline("🔄 Refresh", "status_refresh")]]
+            buttons=REFRESH_BUTTONS
         )
         return
     
-    # Count downloads by status
-    queued = sum(1 for task in user_downloads if task.status == "queued")
-    downloading = sum(1 for task in user_downloads if task.status == "downloading")
-    completed = sum(1 for task in user_downloads if task.status == "completed")
-    failed = sum(1 for task in user_downloads if task.status == "failed")
+    # Counts and overall progress are maintained as downloads change state
+    stats = download_manager.get_user_stats(user_id)
+    queued = stats.queued
+    downloading = stats.downloading
+    completed = stats.completed
+    failed = stats.failed
     
-    # Calculate total progress
-    total_downloaded = sum(task.downloaded_bytes for task in user_downloads if task.status == "downloading")
-    total_size = sum(task.total_bytes for task in user_downloads if task.status == "downloading")
-    overall_progress = (total_downloaded / total_size * 100) if total_size > 0 else 0
+    overall_progress = (stats.bytes_downloaded / stats.bytes_total * 100) if stats.bytes_total > 0 else 0
     
-    status_text = f"""
+    status_parts = [f"""
 📊 **Download Manager** (Refreshed)
 
 📈 **Overall Progress:** {overall_progress:.1f}%
@@ -244,32 +252,12 @@ async def handle_status_refresh(event, user_id: str):
 • ❌ Failed: {failed}
 
 📋 **Active Downloads:**
-"""
+"""]
     
     # Show active downloads (downloading and queued)
-    active_downloads = [task for task in user_downloads if task.status in ["queued", "downloading"]]
-    for i, task in enumerate(active_downloads[:5], 1):  # Show max 5 active downloads
-        filename = os.path.basename(task.save_path)
-        if task.status == "queued":
-            status_text += f"{i}. ⏳ **{filename}** - Waiting in queue\n"
-        elif task.status == "downloading":
-            progress = (task.downloaded_bytes / task.total_bytes * 100) if task.total_bytes > 0 else 0
-            downloaded_mb = task.downloaded_bytes / (1024*1024)
-            total_mb = task.total_bytes / (1024*1024)
-            elapsed_time = time.time() - task.start_time
-            speed = task.downloaded_bytes / elapsed_time if elapsed_time > 0 else 0
-            speed_mb = speed / (1024*1024)
-            eta_seconds = (task.total_bytes - task.downloaded_bytes) / speed if speed > 0 else 0
-            eta_minutes = eta_seconds / 60
-            
-            status_text += f"{i}. 📥 **{filename}**\n"
-            status_text += f"   Progress: {progress:.1f}%\n"
-            status_text += f"   Speed: {speed_mb:.1f} MB/s\n"
-            status_text += f"   Downloaded: {downloaded_mb:.1f} MB / {total_mb:.1f} MB\n"
-            status_text += f"   ETA: {eta_minutes:.1f} min\n\n"
+    status_parts.append(format_active_downloads(stats.active))
     
-    if len(active_downloads) > 5:
-        status_text += f"... and {len(active_downloads) - 5} more downloads\n"
+    status_text = "".join(status_parts)
     
     # Create interactive buttons
     buttons = create_status_keyboard(queued, downloading, failed, completed)
@@ -283,51 +271,47 @@ async def handle_show_all_downloads(event, user_id: str):
         await event.edit("No downloads found.")
         return
     
-    status_text = "📋 **All Downloads:**\n\n"
+    status_parts = ["📋 **All Downloads:**\n\n"]
+    now = time.monotonic()
     
+    # Bound once, so each task costs a local lookup and one status read
+    append = status_parts.append
     for i, task in enumerate(user_downloads, 1):
-        filename = os.path.basename(task.save_path)
-        if task.status == "queued":
-            status_text += f"{i}. ⏳ **{filename}** - Waiting in queue\n"
-        elif task.status == "downloading":
-            progress = (task.downloaded_bytes / task.total_bytes * 100) if task.total_bytes > 0 else 0
-            downloaded_mb = task.downloaded_bytes / (1024*1024)
-            total_mb = task.total_bytes / (1024*1024)
-            elapsed_time = time.time() - task.start_time
-            speed = task.downloaded_bytes / elapsed_time if elapsed_time > 0 else 0
-            speed_mb = speed / (1024*1024)
-            eta_seconds = (task.total_bytes - task.downloaded_bytes) / speed if speed > 0 else 0
-            eta_minutes = eta_seconds / 60
-            
-            status_text += f"{i}. 📥 **{filename}**\n"
-            status_text += f"   Progress: {progress:.1f}%\n"
-            status_text += f"   Speed: {speed_mb:.1f} MB/s\n"
-            status_text += f"   Downloaded: {downloaded_mb:.1f} MB / {total_mb:.1f} MB\n"
-            status_text += f"   ETA: {eta_minutes:.1f} min\n\n"
-        elif task.status == "completed":
-            status_text += f"{i}. ✅ **{filename}** - Completed\n"
-        elif task.status == "failed":
+        status = task.status
+        if status == "completed":
+            append(f"{i}. ✅ **{task.basename}** - Completed\n")
+        elif status == "failed":
             error_msg = task.error if task.error else "Unknown error"
-            status_text += f"{i}. ❌ **{filename}** - Failed: {error_msg}\n"
+            append(f"{i}. ❌ **{task.basename}** - Failed: {error_msg}\n")
+        else:
+            # Queued and downloading tasks render as in the status message
+            append(format_download_entry(i, task, now))
     
-    buttons = create_back_button("status_refresh")
+    status_text = "".join(status_parts)
+    buttons = _STATUS_BACK_BUTTONS
     await event.edit(status_text, buttons=buttons)
 
 async def handle_clear_completed(event, user_id: str):
     """Handle clear completed downloads callback."""
+    if await _is_refresh_debounced(event, user_id):
+        return
+    
     cleared_count = download_manager.clear_completed_downloads(user_id)
     if cleared_count > 0:
         await event.answer(f"✅ {cleared_count} completed downloads cleared!")
         await event.edit(
             f"📊 **Download Manager**\n\n"
             f"✅ {cleared_count} completed downloads have been cleared from the queue.",
-            buttons=[[Button.inline("🔄 Refresh", "status_refresh")]]
+            buttons=REFRESH_BUTTONS
         )
     else:
         await event.answer("No downloads to clear.")
 
 async def handle_retry_failed(event, user_id: str):
     """Handle retry failed downloads callback."""
+    if await _is_refresh_debounced(event, user_id):
+        return
+    
     retry_count = download_manager.retry_failed_downloads(user_id)
     
     if retry_count > 0:
@@ -335,11 +319,30 @@ async def handle_retry_failed(event, user_id: str):
         await event.edit(
             f"📊 **Download Manager**\n\n"
             f"🔄 Retrying {retry_count} failed downloads...",
-            buttons=[[Button.inline("🔄 Refresh", "status_refresh")]]
+            buttons=REFRESH_BUTTONS
         )
     else:
         await event.answer("No failed downloads to retry.")
 
+# Callback dispatch tables: exact matches first, then prefixed callback data
+CALLBACK_HANDLERS = {
+    'skip_rename': handle_skip_rename,
+    'rename_file': handle_rename_file,
+    'status_refresh': handle_status_refresh,
+    'show_all_downloads': handle_show_all_downloads,
+    'clear_completed': handle_clear_completed,
+    'pause_all': handle_pause_all,
+    'resume_all': handle_resume_all,
+    'retry_failed': handle_retry_failed,
+}
+
+PREFIX_CALLBACK_HANDLERS = (
+    ('dir:', handle_directory_navigation),
+    ('select:', handle_directory_selected),
+    ('create_folder:', handle_create_folder),
+    ('help_', handle_help_page),
+)
+
 async def download_file(event, user_id: str, filename: str = None):
     """Queue file for download instead of downloading immediately."""
     try:
@@ -350,36 +353,29 @@ async def download_file(event, user_id: str, filename: str = None):
         # Determine save path - use full system path
         save_dir = selected_dir if selected_dir else '.'
         
-        # Check if directory exists and is writable
-        if not path_manager.ensure_directory_exists(save_dir):
+        # Check the directory is allowed, then that it exists and is writable off the event loop thread
+        if not path_manager.is_path_allowed(save_dir) or not await asyncio.to_thread(path_manager.ensure_directory_exists, save_dir):
             error_msg = f"❌ **Permission Error!**\n\nCannot create directory: {save_dir}\n\n**Error:** Permission denied\n\nPlease choose a different location or check permissions."
             await download_manager.send_notification(user_id, error_msg)
             await event.respond(f"❌ Permission denied: Cannot create directory {save_dir}")
             user_state.set_state(user_id, 'logged_in', chat_id=chat_id)
             return
-        elif not path_manager.is_directory_writable(save_dir):
+        elif not await asyncio.to_thread(path_manager.is_directory_writable, save_dir):
             error_msg = f"❌ **Permission Error!**\n\nCannot write to directory: {save_dir}\n\n**Error:** Directory is read-only\n\nPlease choose a different location."
             await download_manager.send_notification(user_id, error_msg)
             await event.respond(f"❌ Permission denied: Cannot write to directory {save_dir}")
             user_state.set_state(user_id, 'logged_in', chat_id=chat_id)
             return
+        # The directory may be new, so listings of its parents are refreshed
+        path_manager.invalidate_directory_listing(save_dir)
         
-        # Get original filename and extension
-        original_filename = None
-        original_extension = None
-        
-        if hasattr(file_message.media, 'document') and file_message.media.document:
-            original_filename = file_message.media.document.attributes[0].file_name
-            if original_filename:
-                original_extension = path_manager.get_file_extension(original_filename)
+        # Original filename, resolved when the file was forwarded
+        original_filename = user_state.get_user_data(user_id, 'original_filename')
         
         # Handle filename logic
         if not filename:
             # Use original filename
-            if original_filename:
-                final_filename = original_filename
-            else:
-                final_filename = f"file_{int(asyncio.get_event_loop().time())}"
+            final_filename = original_filename or f"file_{int(asyncio.get_event_loop().time())}"
         else:
             # User provided a new filename
             user_filename = filename.strip()
@@ -390,23 +386,26 @@ async def download_file(event, user_id: str, filename: str = None):
             if user_ext:
                 # User provided extension, use it as-is
                 final_filename = user_filename
-                logger.info(f"User provided extension: {user_ext}, using: {final_filename}")
+                logger.info("User provided extension: %s, using: %s", user_ext, final_filename)
             else:
                 # User provided only name, use original extension
+                original_extension = (
+                    path_manager.get_file_extension(original_filename) if original_filename else None
+                )
                 if original_extension:
                     final_filename = f"{user_name}{original_extension}"
-                    logger.info(f"Using original extension {original_extension}, final filename: {final_filename}")
+                    logger.info("Using original extension %s, final filename: %s", original_extension, final_filename)
                 else:
                     # No original extension, use as-is
                     final_filename = user_filename
-                    logger.info(f"No original extension found, using as-is: {final_filename}")
+                    logger.info("No original extension found, using as-is: %s", final_filename)
         
         # Sanitize the final filename to remove problematic characters
         final_filename = path_manager.sanitize_filename(final_filename)
         
         save_path = path_manager.join_paths(save_dir, final_filename)
         
-        logger.info(f"Queuing download to: {save_path}")
+        logger.info("Queuing download to: %s", save_path)
         await event.respond(f"📥 Queuing download to: {save_path}")
         
         # Queue the download
@@ -416,13 +415,13 @@ async def download_file(event, user_id: str, filename: str = None):
         user_state.set_state(user_id, 'logged_in', chat_id=chat_id)
         
     except PermissionError as e:
-        logger.error(f"Permission error queuing download: {e}")
+        logger.error("Permission error queuing download: %s", e)
         error_msg = f"❌ **Permission Error!**\n\nCannot write to the selected directory.\n\n**Error:** {str(e)}\n\nPlease choose a different location."
         await download_manager.send_notification(user_id, error_msg)
         await event.respond(f"❌ Permission denied: Cannot write to the selected directory. Please choose a different location.")
         user_state.set_state(user_id, 'logged_in', chat_id=event.chat_id)
     except Exception as e:
-        logger.error(f"Error queuing download: {e}")
+        logger.error("Error queuing download: %s", e)
         error_msg = f"❌ **Download Error!**\n\nFailed to queue download.\n\n**Error:** {str(e)}\n\nPlease try again or contact support."
         await download_manager.send_notification(user_id, error_msg)
         await event.respond(f"❌ Error queuing download: {e}")
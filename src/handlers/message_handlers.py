@@ -4,13 +4,16 @@ Handles text messages, file forwarding, and user state transitions.
 """
 
 import os
+import asyncio
 import logging
+from typing import Optional
 from telethon import events
 from telethon.errors import SessionPasswordNeededError
+from telethon.tl.types import DocumentAttributeFilename
 
 from ..core.config import config
 from ..core.user_state import user_state
-from ..bot.client import client
+from ..bot.client import client, set_logged_in_cache
 from ..utils.path_utils import path_manager
 from ..utils.keyboard_utils import create_directory_keyboard
 from ..downloads.download_manager import download_manager
@@ -20,17 +23,22 @@ logger = logging.getLogger(__name__)
 @client.on(events.NewMessage())
 async def message_handler(event):
     """Handle all incoming messages based on user state."""
+    # Commands are handled by their own handlers, skip the state machine for them;
+    # raw_text of a file is its caption, so files are never skipped
+    if not event.message.media and event.raw_text.startswith('/'):
+        return
+    
     user_id = str(event.sender_id)
     chat_id = event.chat_id
     
-    if not user_state.is_authorized(user_id, config.allowed_users):
+    if not user_state.is_authorized(event.sender_id, config.allowed_users):
         return
     
     # Update chat_id in user state
     user_state.set_chat_id(user_id, chat_id)
     
     state = user_state.get_state(user_id)
-    logger.info(f"User {user_id} sent message in state: {state}")
+    logger.info("User %s sent message in state: %s", user_id, state)
     
     # Handle users who haven't started the bot
     if state is None:
@@ -56,22 +64,22 @@ async def message_handler(event):
         await handle_logged_in_message(event, user_id)
     
     else:
-        logger.warning(f"User {user_id} in unknown state: {state}")
+        logger.warning("User %s in unknown state: %s", user_id, state)
         await event.respond("Please use /start to begin using the bot.")
 
 async def handle_phone_input(event, user_id: str):
     """Handle phone number input during login."""
     phone = event.raw_text.strip()
-    logger.info(f"User {user_id} provided phone number: {phone}")
+    logger.info("User %s provided phone number: %s", user_id, phone)
     
     user_state.set_state(user_id, 'awaiting_code', phone=phone)
     
     try:
         await client.send_code_request(phone)
-        logger.info(f"Code request sent to {phone}")
+        logger.info("Code request sent to %s", phone)
         await event.respond('A code has been sent to your Telegram. Please enter the code:')
     except Exception as e:
-        logger.error(f"Failed to send code to {phone}: {e}")
+        logger.error("Failed to send code to %s: %s", phone, e)
         error_msg = f"❌ **Login Error!**\n\nFailed to send verification code to {phone}.\n\n**Error:** {str(e)}\n\nPlease try again with a valid phone number."
         await download_manager.send_notification(user_id, error_msg)
         user_state.set_state(user_id, 'awaiting_phone')
@@ -81,19 +89,20 @@ async def handle_code_input(event, user_id: str):
     """Handle verification code input during login."""
     code = event.raw_text.strip()
     phone = user_state.get_user_data(user_id, 'phone')
-    logger.info(f"User {user_id} provided code for {phone}")
+    logger.info("User %s provided code for %s", user_id, phone)
     
     try:
         await client.sign_in(phone, code)
-        logger.info(f"User {user_id} successfully signed in")
+        logger.info("User %s successfully signed in", user_id)
+        set_logged_in_cache(True)
         user_state.set_state(user_id, 'logged_in')
         await event.respond('Login successful! Forward me a file and I will download it for you.')
     except SessionPasswordNeededError:
-        logger.info(f"User {user_id} needs 2FA password")
+        logger.info("User %s needs 2FA password", user_id)
         user_state.set_state(user_id, 'awaiting_2fa', phone=phone, code=code)
         await event.respond('Two-step verification is enabled. Please enter your password:')
     except Exception as e:
-        logger.error(f"Login failed for user {user_id}: {e}")
+        logger.error("Login failed for user %s: %s", user_id, e)
         error_msg = f"❌ **Login Error!**\n\nFailed to verify code for {phone}.\n\n**Error:** {str(e)}\n\nPlease try again with the correct code."
         await download_manager.send_notification(user_id, error_msg)
         user_state.set_state(user_id, 'awaiting_phone')
@@ -104,15 +113,16 @@ async def handle_2fa_input(event, user_id: str):
     password = event.raw_text.strip()
     phone = user_state.get_user_data(user_id, 'phone')
     code = user_state.get_user_data(user_id, 'code')
-    logger.info(f"User {user_id} provided 2FA password")
+    logger.info("User %s provided 2FA password", user_id)
     
     try:
         await client.sign_in(phone, code, password=password)
-        logger.info(f"User {user_id} successfully signed in with 2FA")
+        logger.info("User %s successfully signed in with 2FA", user_id)
+        set_logged_in_cache(True)
         user_state.set_state(user_id, 'logged_in')
         await event.respond('Login successful! Forward me a file and I will download it for you.')
     except Exception as e:
-        logger.error(f"2FA failed for user {user_id}: {e}")
+        logger.error("2FA failed for user %s: %s", user_id, e)
         error_msg = f"❌ **2FA Error!**\n\nFailed to verify 2FA password.\n\n**Error:** {str(e)}\n\nPlease try again with the correct password."
         await download_manager.send_notification(user_id, error_msg)
         user_state.set_state(user_id, 'awaiting_phone')
@@ -147,9 +157,14 @@ async def handle_folder_name_input(event, user_id: str):
     new_folder_path = path_manager.join_paths(create_path, safe_folder_name)
     
     try:
-        # Create the folder
-        if path_manager.ensure_directory_exists(new_folder_path):
-            logger.info(f"User {user_id} created folder: {new_folder_path}")
+        # Reject folders outside the allowed base directories before touching the disk
+        if not path_manager.is_path_allowed(new_folder_path):
+            raise PermissionError("Folder is outside the allowed directories")
+        
+        # Create the folder off the event loop
+        if await asyncio.to_thread(path_manager.ensure_directory_exists, new_folder_path):
+            path_manager.invalidate_directory_listing(new_folder_path)
+            logger.info("User %s created folder: %s", user_id, new_folder_path)
             
             # Navigate to the newly created folder
             buttons = await create_directory_keyboard(new_folder_path)
@@ -172,16 +187,29 @@ async def handle_folder_name_input(event, user_id: str):
         await event.respond(f"❌ Permission denied: Cannot create folder {safe_folder_name}")
         user_state.set_state(user_id, 'logged_in')
     except Exception as e:
-        logger.error(f"Error creating folder: {e}")
+        logger.error("Error creating folder: %s", e)
         await event.respond(f"❌ Error creating folder: {e}")
         user_state.set_state(user_id, 'logged_in')
 
+def document_file_name(media) -> Optional[str]:
+    """Return a document's file name, wherever its filename attribute sits in the list."""
+    document = getattr(media, 'document', None)
+    for attribute in getattr(document, 'attributes', None) or ():
+        # Videos and audio list their Video/Audio attribute first
+        if isinstance(attribute, DocumentAttributeFilename):
+            return attribute.file_name
+    return None
+
 async def handle_logged_in_message(event, user_id: str):
     """Handle messages when user is logged in."""
     # Check if message contains a file
     if event.message.media:
-        logger.info(f"User {user_id} forwarded a file")
-        user_state.set_user_data(user_id, 'file_message', event.message)
+        logger.info("User %s forwarded a file", user_id)
+        # Resolve the original filename once, so downloads without a rename skip it
+        original_filename = document_file_name(event.message.media)
+        user_state.update_user_data(
+            user_id, file_message=event.message, original_filename=original_filename
+        )
         user_state.set_state(user_id, 'selecting_directory')
         
         # Show directory selection
@@ -194,12 +222,11 @@ async def handle_logged_in_message(event, user_id: str):
         # Only respond to text messages that are commands or specific requests
         message_text = event.raw_text.strip().lower() if event.raw_text else ""
         
-        # Ignore empty messages or non-command messages to prevent spam
-        if not message_text or message_text in ['/start', '/help', '/status']:
-            # These commands are handled by their specific handlers
+        # Ignore empty messages to prevent spam
+        if not message_text:
             return
         else:
             # Only respond to actual requests, not random messages
-            logger.info(f"User {user_id} sent message while logged in: {event.raw_text[:50]}...")
+            logger.info("User %s sent message while logged in: %s...", user_id, event.raw_text[:50])
             # Don't respond to every message to prevent flood wait
             return 
\ No newline at end of file
@@ -14,43 +14,33 @@ async def create_directory_keyboard(current_path: str = ''):
     """Create inline keyboard for directory selection."""
     items = await path_manager.get_directory_options(current_path)
     
-    buttons = []
-    for item, item_type in items:
-        if item_type == 'dir':
-            new_path = path_manager.join_paths(current_path, item) if current_path else item
-            encoded_path = path_manager.encode_path(new_path)
-            buttons.append([Button.inline(f"📁 {item}", f"dir:{encoded_path}")])
+    # Build the directory rows in one pass over the (cached) listing
+    join_paths = path_manager.join_paths
+    encode_path = path_manager.encode_path
+    buttons = [
+        [Button.inline(f"📁 {item}", f"dir:{encode_path(join_paths(current_path, item) if current_path else item)}")]
+        for item, item_type in items
+        if item_type == 'dir'
+    ]
     
-    # Add navigation buttons
-    nav_buttons = []
+    # Encode navigation targets once and reuse them for every button below
+    # Always show Back button: from a subdirectory go to its parent, otherwise use '..'
+    parent_path = path_manager.get_parent_directory(current_path) if current_path else '..'
+    encoded_parent = path_manager.encode_path(parent_path)
+    encoded_current = path_manager.encode_path(current_path)
     
-    # Always show Back button if we can go up (even from current directory)
-    if current_path:
-        # We're in a subdirectory, go to parent
-        parent_path = path_manager.get_parent_directory(current_path)
-        encoded_parent = path_manager.encode_path(parent_path)
-        nav_buttons.append(Button.inline("⬆️ Back", f"dir:{encoded_parent}"))
-    else:
-        # We're in current directory (.), go to parent directory
-        # Use '..' as the parent path when we're in current directory
-        encoded_parent = path_manager.encode_path('..')
-        nav_buttons.append(Button.inline("⬆️ Back", f"dir:{encoded_parent}"))
+    # Add navigation buttons
+    nav_buttons = [Button.inline("⬆️ Back", f"dir:{encoded_parent}")]
     
     # Add "Go to Root" button for easier navigation
     if current_path != '/':
         nav_buttons.append(Button.inline("🏠 Root", f"dir:/"))
     
-    encoded_current = path_manager.encode_path(current_path)
     nav_buttons.append(Button.inline("✅ Use Here", f"select:{encoded_current}"))
-    
-    if nav_buttons:
-        buttons.append(nav_buttons)
+    buttons.append(nav_buttons)
     
     # Add folder management buttons
-    folder_buttons = []
-    folder_buttons.append(Button.inline("📁 Create New Folder", f"create_folder:{encoded_current}"))
-    if folder_buttons:
-        buttons.append(folder_buttons)
+    buttons.append([Button.inline("📁 Create New Folder", f"create_folder:{encoded_current}")])
     
     return buttons
 
@@ -4,48 +4,103 @@ Handles directory navigation, path encoding, and file operations.
 """
 
 import os
+import asyncio
 import logging
-from typing import List, Tuple, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
+# Directory names hidden from the navigation keyboard for safety
+SKIPPED_DIRECTORIES = frozenset({'System', 'Library', 'Applications', 'bin', 'sbin', 'dev', 'proc', 'sys'})
+
+# Translation table replacing path separators and dropping NUL bytes in a single pass
+_SANITIZE_TABLE = str.maketrans({'/': '_', '\\': '_', '\0': None})
+
+# Maximum number of path encodings kept before the least recently used are evicted
+MAX_PATH_ENCODINGS = 4096
+
+# Directory listings are reused for this many seconds, and dropped entirely after the max age
+DIRECTORY_CACHE_TTL = 5.0
+DIRECTORY_CACHE_MAX_AGE = 60.0
+
 class PathManager:
     """Path management class for directory navigation and path encoding."""
     
     def __init__(self):
-        # Path encoding system to avoid callback data size limits
-        self.path_encodings = {}
+        # Path encoding system to avoid callback data size limits, kept in LRU order
+        self.path_encodings: OrderedDict = OrderedDict()
+        # Reverse lookup so decoding a callback is O(1)
+        self.code_to_path = {}
         self.path_counter = 0
+        # Short-lived directory listing cache keyed by absolute path
+        self._dir_cache: Dict[str, Tuple[float, List[Tuple[str, str]]]] = {}
+        # Writable base directories set at startup; None leaves paths unrestricted
+        self.allowed_base_dirs: Optional[frozenset] = None
+        self._allowed_prefixes: Tuple[str, ...] = ()
+        self._base_cwd = os.getcwd()
     
     def encode_path(self, path: str) -> str:
         """Encode a path to a short identifier."""
-        if path not in self.path_encodings:
-            self.path_encodings[path] = str(self.path_counter)
-            self.path_counter += 1
-        return self.path_encodings[path]
+        code = self.path_encodings.get(path)
+        if code is not None:
+            self.path_encodings.move_to_end(path)
+            return code
+        
+        # Codes come from a monotonic counter so eviction never renumbers live codes
+        code = str(self.path_counter)
+        self.path_encodings[path] = code
+        self.code_to_path[code] = path
+        self.path_counter += 1
+        
+        if len(self.path_encodings) > MAX_PATH_ENCODINGS:
+            _, evicted_code = self.path_encodings.popitem(last=False)
+            del self.code_to_path[evicted_code]
+        return code
     
     def decode_path(self, encoded: str) -> str:
         """Decode a short identifier back to a path."""
-        for path, code in self.path_encodings.items():
-            if code == encoded:
-                return path
-        return '.'
+        path = self.code_to_path.get(encoded)
+        if path is None:
+            return '.'
+        self.path_encodings.move_to_end(path)
+        return path
     
     async def get_directory_options(self, current_path: str = '') -> List[Tuple[str, str]]:
         """Get directory options for the current path."""
         full_path = current_path if current_path else '.'
-        if not os.path.exists(full_path):
-            return []
+        key = os.path.abspath(full_path)
+        now = time.monotonic()
+        cached_at, items = self._dir_cache.get(key, (0.0, None))
+        if items is not None and now - cached_at < DIRECTORY_CACHE_TTL:
+            return items
         
+        # Enumerate in a worker thread so slow filesystems don't stall the event loop
+        items = await asyncio.to_thread(self._scan_directory, full_path)
+        
+        # Opportunistically drop stale listings to keep the cache small
+        stale_keys = [k for k, (ts, _) in self._dir_cache.items() if now - ts > DIRECTORY_CACHE_MAX_AGE]
+        for stale_key in stale_keys:
+            del self._dir_cache[stale_key]
+        self._dir_cache[key] = (now, items)
+        return items
+    
+    def _scan_directory(self, full_path: str) -> List[Tuple[str, str]]:
+        """List navigable subdirectories of a path (blocking)."""
         items = []
         try:
-            for item in os.listdir(full_path):
-                item_path = os.path.join(full_path, item)
-                if os.path.isdir(item_path):
-                    # Skip hidden directories and system directories for safety
-                    if not item.startswith('.') and item not in ['System', 'Library', 'Applications', 'bin', 'sbin', 'dev', 'proc', 'sys']:
-                        items.append((item, 'dir'))
+            # DirEntry.is_dir() uses the d_type cached by scandir, avoiding a stat() per entry
+            with os.scandir(full_path) as entries:
+                # Skip hidden directories and system directories for safety
+                items = [
+                    (entry.name, 'dir') for entry in entries
+                    if entry.is_dir(follow_symlinks=False)
+                    and not entry.name.startswith('.')
+                    and entry.name not in SKIPPED_DIRECTORIES
+                ]
         except (PermissionError, OSError) as e:
+            # Also covers FileNotFoundError, so no separate exists() check is needed
             logger.warning(f"Permission denied or error accessing {full_path}: {e}")
         except Exception as e:
             logger.error(f"Error listing directory {full_path}: {e}")
@@ -55,7 +110,7 @@ class PathManager:
     def sanitize_filename(self, filename: str) -> str:
         """Sanitize a filename to be safe for filesystem operations."""
         # Replace problematic characters
-        safe_filename = filename.replace('/', '_').replace('\\', '_').strip()
+        safe_filename = filename.translate(_SANITIZE_TABLE).strip()
         return safe_filename
     
     def get_file_extension(self, filename: str) -> str:
@@ -82,6 +137,48 @@ class PathManager:
             logger.error(f"Failed to create directory {directory}: {e}")
             return False
     
+    def invalidate_directory_listing(self, directory: str) -> None:
+        """Drop cached listings that may miss a newly created directory.
+        
+        Called on the event loop thread, after ensure_directory_exists returns,
+        since get_directory_options iterates the cache there.
+        """
+        # makedirs may have created several levels, so every ancestor is dropped
+        path = os.path.abspath(directory)
+        parent = os.path.dirname(path)
+        while parent != path:
+            self._dir_cache.pop(parent, None)
+            path, parent = parent, os.path.dirname(parent)
+    
+    def set_allowed_base_dirs(self, base_dirs: Iterable[str]) -> None:
+        """Restrict created folders and downloads to base directories that are writable now."""
+        base_dirs = list(base_dirs)
+        if not base_dirs:
+            self.allowed_base_dirs = None
+            self._allowed_prefixes = ()
+            return
+        
+        writable_dirs = set()
+        for base_dir in base_dirs:
+            full_path = os.path.abspath(base_dir)
+            if os.access(full_path, os.W_OK):
+                writable_dirs.add(full_path)
+            else:
+                logger.warning(f"Ignoring allowed base directory that is not writable: {full_path}")
+        
+        self.allowed_base_dirs = frozenset(writable_dirs)
+        self._allowed_prefixes = tuple(
+            base_dir.rstrip(os.sep) + os.sep for base_dir in writable_dirs
+        )
+        self._base_cwd = os.getcwd()
+    
+    def is_path_allowed(self, path: str) -> bool:
+        """Check whether a path lies under an allowed base directory, without syscalls."""
+        if self.allowed_base_dirs is None:
+            return True
+        full_path = os.path.normpath(os.path.join(self._base_cwd, path))
+        return full_path in self.allowed_base_dirs or full_path.startswith(self._allowed_prefixes)
+    
     def get_parent_directory(self, path: str) -> str:
         """Get the parent directory of a path."""
         parent = os.path.dirname(path)
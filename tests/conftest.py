@@ -30,8 +30,8 @@ def mock_config():
         'BOT_TOKEN': 'test_token',
         'ALLOWED_USERS': '123456,789012'
     }):
-        from src.core.config import Config
-        return Config()
+        from src.core.config import build_config
+        return build_config()
 
 @pytest.fixture
 def mock_user_state():
@@ -10,7 +10,7 @@ from telethon import TelegramClient
 from telethon.tl.types import User, Document, DocumentAttributeFilename
 import os
 
-from src.core.config import Config
+from src.core.config import build_config
 from src.core.user_state import UserState
 from src.bot.client import client
 from src.downloads.download_manager import DownloadManager
@@ -31,7 +31,7 @@ class TestBotIntegration:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': '123456,789012'
         }):
-            config = Config()
+            config = build_config()
             user_state = UserState()
             download_manager = DownloadManager()
             path_manager = PathManager()
@@ -42,6 +42,7 @@ class TestBotIntegration:
                 'download_manager': download_manager,
                 'path_manager': path_manager
             }
+            await download_manager.stop()
 
     @pytest.mark.asyncio
     async def test_user_login_flow(self, setup_bot_components):
@@ -53,7 +54,7 @@ class TestBotIntegration:
         user_id = "123456"
         
         # Test user authorization
-        assert user_state.is_authorized(user_id, config.allowed_users) is True
+        assert user_state.is_authorized(int(user_id), config.allowed_users) is True
         
         # Test state transitions
         user_state.set_state(user_id, 'awaiting_phone', chat_id=789012)
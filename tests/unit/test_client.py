@@ -0,0 +1,95 @@
+"""
+Unit tests for the Telegram client module.
+"""
+
+import os
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from telethon.network import ConnectionTcpAbridged
+from src.bot import client as client_module
+from src.bot.client import TunedSQLiteSession
+
+
+class TestTunedSQLiteSession:
+    """Test cases for the TunedSQLiteSession class."""
+
+    def test_session_uses_wal_journal(self, temp_dir):
+        """Test that the session database is switched to WAL with normal syncing."""
+        session = TunedSQLiteSession(os.path.join(temp_dir, "bot"))
+        try:
+            cursor = session._cursor()
+            assert cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert cursor.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            cursor.close()
+        finally:
+            session.close()
+
+    def test_session_persists_auth_data(self, temp_dir):
+        """Test that data saved through the tuned session survives a reopen."""
+        path = os.path.join(temp_dir, "bot")
+        session = TunedSQLiteSession(path)
+        session.set_dc(2, "149.154.167.51", 443)
+        session.save()
+        session.close()
+
+        reopened = TunedSQLiteSession(path)
+        try:
+            assert reopened.dc_id == 2
+            assert reopened.server_address == "149.154.167.51"
+        finally:
+            reopened.close()
+
+
+class TestGetClient:
+    """Test cases for the shared client factory."""
+
+    @patch("src.bot.client.TunedSQLiteSession")
+    @patch("src.bot.client.TelegramClient")
+    def test_get_client_builds_one_tuned_client(self, mock_client_class, mock_session):
+        """Test that the client is created once, with abridged framing and configured retries."""
+        from src.core.config import get_config
+
+        config = get_config()
+        client_module.get_client.cache_clear()
+        try:
+            first = client_module.get_client()
+            assert client_module.get_client() is first
+        finally:
+            client_module.get_client.cache_clear()
+
+        mock_client_class.assert_called_once()
+        kwargs = mock_client_class.call_args.kwargs
+        assert kwargs["connection"] is ConnectionTcpAbridged
+        assert kwargs["request_retries"] == config.request_retries
+        assert kwargs["flood_sleep_threshold"] == config.flood_sleep_threshold
+
+
+class TestIsLoggedIn:
+    """Test cases for the cached login check."""
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.get_client")
+    async def test_login_check_is_cached_until_ttl(self, mock_get_client):
+        """Test that get_me() runs once per TTL window and again after invalidation."""
+        mock_get_client.return_value.get_me = AsyncMock(
+            return_value=Mock(username="bot", id=1)
+        )
+        client_module.set_logged_in_cache(None)
+        try:
+            assert await client_module.is_logged_in() is True
+            assert await client_module.is_logged_in() is True
+            assert mock_get_client.return_value.get_me.await_count == 1
+
+            client_module.set_logged_in_cache(None)
+            assert await client_module.is_logged_in() is True
+            assert mock_get_client.return_value.get_me.await_count == 2
+
+            # An expired entry is checked again
+            with patch(
+                "src.bot.client.time.monotonic_ns",
+                return_value=client_module._logged_in_expires,
+            ):
+                assert await client_module.is_logged_in() is True
+            assert mock_get_client.return_value.get_me.await_count == 3
+        finally:
+            client_module.set_logged_in_cache(None)
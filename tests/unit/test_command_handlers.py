@@ -0,0 +1,34 @@
+"""
+Unit tests for the command handlers module.
+"""
+
+import pytest
+from src.handlers.command_handlers import START_PATTERN, HELP_PATTERN, STATUS_PATTERN
+
+
+class TestCommandPatterns:
+    """Test cases for the command patterns."""
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "/start",
+            "/start@DownloaderBot",
+            "/start payload",
+            "/start@DownloaderBot payload",
+        ],
+    )
+    def test_start_pattern_accepts_mentions_and_arguments(self, text):
+        """Test that /start matches with a bot mention (groups) or a payload (deep links)."""
+        assert START_PATTERN.match(text)
+
+    @pytest.mark.parametrize("text", ["/startfoo", "/start@", "start", "/status"])
+    def test_start_pattern_rejects_other_commands(self, text):
+        """Test that other commands and longer command names do not trigger /start."""
+        assert not START_PATTERN.match(text)
+
+    def test_help_and_status_patterns_accept_mentions(self):
+        """Test that /help and /status also accept a bot mention."""
+        assert HELP_PATTERN.match("/help@DownloaderBot")
+        assert STATUS_PATTERN.match("/status@DownloaderBot")
+        assert not STATUS_PATTERN.match("/statusx")
@@ -5,7 +5,7 @@ Unit tests for the configuration module.
 import pytest
 import os
 from unittest.mock import patch, mock_open
-from src.core.config import Config, _config_instance
+from src.core.config import build_config
 
 
 class TestConfig:
@@ -14,19 +14,29 @@ class TestConfig:
     def test_config_initialization_success(self, test_env_vars):
         """Test successful configuration initialization."""
         with patch.dict(os.environ, test_env_vars):
-            config = Config()
+            config = build_config()
             
             assert config.api_id == 12345
             assert config.api_hash == 'test_hash_123456789'
             assert config.bot_token == 'test_bot_token_123456789'
-            assert config.allowed_users == {'123456', '789012', '345678'}
+            assert config.allowed_users == {123456, 789012, 345678}
             assert config.session_name == 'downloader_bot_session'
             assert config.base_download_dir == '.'
-            assert config.download_chunk_size == 1024 * 1024
+            assert config.download_chunk_size == 512 * 1024
             assert config.progress_update_interval == 5.0
             assert config.max_concurrent_downloads == 5
             assert config.notification_cooldown == 30
 
+    def test_config_is_frozen_with_slots(self, test_env_vars):
+        """Test that the built configuration cannot be modified."""
+        from dataclasses import FrozenInstanceError
+        with patch.dict(os.environ, test_env_vars):
+            config = build_config()
+            
+            assert not hasattr(config, '__dict__')
+            with pytest.raises(FrozenInstanceError):
+                config.max_concurrent_downloads = 10
+
     def test_config_invalid_api_id(self):
         """Test configuration with invalid API_ID."""
         with patch.dict(os.environ, {
@@ -35,7 +45,7 @@ class TestConfig:
             'BOT_TOKEN': 'test_token'
         }):
             with pytest.raises(ValueError, match="API_ID must be a valid integer"):
-                Config()
+                build_config()
 
     def test_config_empty_allowed_users(self):
         """Test configuration with empty ALLOWED_USERS."""
@@ -45,8 +55,20 @@ class TestConfig:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': ''
         }):
-            config = Config()
-            assert config.allowed_users == set()
+            config = build_config()
+            assert config.allowed_users == frozenset()
+            assert '' not in config.allowed_users
+
+    def test_config_invalid_allowed_users(self):
+        """Test configuration with a non-numeric ALLOWED_USERS entry."""
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            'ALLOWED_USERS': '123456,someone'
+        }):
+            with pytest.raises(ValueError, match="ALLOWED_USERS must be a comma-separated list"):
+                build_config()
 
     def test_config_single_allowed_user(self):
         """Test configuration with single allowed user."""
@@ -56,8 +78,8 @@ class TestConfig:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': '123456'
         }):
-            config = Config()
-            assert config.allowed_users == {'123456'}
+            config = build_config()
+            assert config.allowed_users == {123456}
 
     def test_config_connection_settings(self):
         """Test connection settings are properly set."""
@@ -67,7 +89,7 @@ class TestConfig:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': '123456'
         }):
-            config = Config()
+            config = build_config()
             
             assert config.connection_retries == 5
             assert config.retry_delay == 1
@@ -83,24 +105,43 @@ class TestConfig:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': '123456'
         }):
-            config = Config()
+            config = build_config()
             
-            assert config.download_chunk_size == 1024 * 1024  # 1MB
+            assert config.download_chunk_size == 512 * 1024  # Telethon's request maximum
             assert config.progress_update_interval == 5.0
             assert config.max_concurrent_downloads == 5
             assert config.notification_cooldown == 30
 
     @patch('src.core.config.load_dotenv')
     def test_load_dotenv_called(self, mock_load_dotenv):
-        """Test that load_dotenv is called during initialization."""
+        """Test that load_dotenv is called once, on the first initialization."""
+        from src.core.config import _load_dotenv_once
+        _load_dotenv_once.cache_clear()
         with patch.dict(os.environ, {
             'API_ID': '12345',
             'API_HASH': 'test_hash',
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': '123456'
         }):
-            Config()
+            build_config()
+            build_config()
             mock_load_dotenv.assert_called_once()
+        _load_dotenv_once.cache_clear()
+
+    def test_get_config_returns_single_instance(self):
+        """Test that get_config and the module-level config share one instance."""
+        import src.core.config as config_module
+        config_module.get_config.cache_clear()
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            'ALLOWED_USERS': '123456'
+        }):
+            first = config_module.get_config()
+            assert config_module.get_config() is first
+            assert config_module.config is first
+        config_module.get_config.cache_clear()
 
     def test_config_allowed_users_whitespace_handling(self):
         """Test that whitespace in ALLOWED_USERS is handled correctly."""
@@ -110,8 +151,94 @@ class TestConfig:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': ' 123456 , 789012 , 345678 '
         }):
-            config = Config()
-            assert config.allowed_users == {'123456', '789012', '345678'}
+            config = build_config()
+            assert config.allowed_users == {123456, 789012, 345678}
+
+    def test_config_log_redacts_secrets(self, caplog):
+        """Test that the API hash and bot token never reach the log."""
+        import logging
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            'ALLOWED_USERS': '123456'
+        }), caplog.at_level(logging.INFO, logger='src.core.config'):
+            build_config()
+        assert 'API_HASH: <redacted>' in caplog.text
+        assert 'test_hash' not in caplog.text
+        assert 'test_token' not in caplog.text
+
+    def test_config_skips_debug_diagnostics_at_info(self, caplog):
+        """Test that the .env diagnostics are neither logged nor computed above DEBUG."""
+        import logging
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            'ALLOWED_USERS': '123456'
+        }), caplog.at_level(logging.INFO, logger='src.core.config'), \
+                patch('src.core.config.pathlib.Path.cwd') as mock_cwd:
+            build_config()
+        mock_cwd.assert_not_called()
+        assert '.env file exists' not in caplog.text
+
+    def test_config_numeric_overrides(self):
+        """Test that numeric settings are parsed from the environment with their field types."""
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            'ALLOWED_USERS': '123456',
+            'MAX_CONCURRENT_DOWNLOADS': ' 2 ',
+            'PROGRESS_UPDATE_INTERVAL': '2.5',
+            'NOTIFICATION_COOLDOWN': ''
+        }):
+            config = build_config()
+            assert config.max_concurrent_downloads == 2
+            assert config.progress_update_interval == 2.5
+            assert config.notification_cooldown == 30
+
+    def test_config_invalid_numeric_override(self):
+        """Test that a malformed numeric setting is rejected with its variable name."""
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            'PARALLEL_PARTS': 'four'
+        }):
+            with pytest.raises(ValueError, match="PARALLEL_PARTS must be a valid int"):
+                build_config()
+
+    @pytest.mark.parametrize("env_name, value, message", [
+        ('MAX_CONCURRENT_DOWNLOADS', '0', "MAX_CONCURRENT_DOWNLOADS must be at least 1"),
+        ('PARALLEL_PARTS', '0', "PARALLEL_PARTS must be at least 1"),
+        ('DOWNLOAD_CHUNK_SIZE', '0', "DOWNLOAD_CHUNK_SIZE must be at least 131072"),
+        ('DOWNLOAD_CHUNK_SIZE', '1048576', "DOWNLOAD_CHUNK_SIZE must be at most 524288"),
+        ('DOWNLOAD_RETRIES', '-1', "DOWNLOAD_RETRIES must be at least 0"),
+        ('PROGRESS_UPDATE_INTERVAL', '0', "PROGRESS_UPDATE_INTERVAL must be at least 1"),
+    ])
+    def test_config_out_of_range_numeric_override(self, env_name, value, message):
+        """Test that numeric settings outside their range are rejected with the variable name."""
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            env_name: value
+        }):
+            with pytest.raises(ValueError, match=message):
+                build_config()
+
+    def test_config_allowed_base_dirs(self):
+        """Test that ALLOWED_BASE_DIRS is parsed into a set of paths."""
+        with patch.dict(os.environ, {
+            'API_ID': '12345',
+            'API_HASH': 'test_hash',
+            'BOT_TOKEN': 'test_token',
+            'ALLOWED_USERS': '123456',
+            'ALLOWED_BASE_DIRS': ' /data/downloads , /mnt/media ,'
+        }):
+            config = build_config()
+            assert config.allowed_base_dirs == {'/data/downloads', '/mnt/media'}
 
     def test_config_zero_api_id(self):
         """Test configuration with API_ID of 0."""
@@ -121,7 +248,7 @@ class TestConfig:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': '123456'
         }):
-            config = Config()
+            config = build_config()
             assert config.api_id == 0
 
     def test_config_negative_api_id(self):
@@ -132,5 +259,5 @@ class TestConfig:
             'BOT_TOKEN': 'test_token',
             'ALLOWED_USERS': '123456'
         }):
-            config = Config()
+            config = build_config()
             assert config.api_id == -12345 
\ No newline at end of file
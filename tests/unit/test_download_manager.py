@@ -3,9 +3,33 @@ Unit tests for the download manager module.
 """
 
 import pytest
+import pytest_asyncio
 import time
-from unittest.mock import Mock, AsyncMock, patch
-from src.downloads.download_manager import DownloadTask, DownloadManager
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
+from src.downloads.download_manager import (
+    DownloadTask,
+    DownloadManager,
+    RetryGuard,
+    UserDownloadStats,
+    DOWNLOADS_FINISHED_TEXT,
+    format_active_downloads,
+)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def stop_download_managers():
+    """Stop every DownloadManager a test creates, so no background task outlives it."""
+    managers = []
+    init = DownloadManager.__init__
+
+    def tracking_init(self):
+        init(self)
+        managers.append(self)
+
+    with patch.object(DownloadManager, "__init__", tracking_init):
+        yield
+    for manager in managers:
+        await manager.stop()
 
 
 class TestDownloadTask:
@@ -15,33 +39,78 @@ class TestDownloadTask:
         """Test DownloadTask initialization."""
         file_message = Mock()
         task = DownloadTask("123456", file_message, "/test/path/file.txt")
-        
+
         assert task.user_id == "123456"
         assert task.file_message == file_message
         assert task.save_path == "/test/path/file.txt"
-        assert task.progress_message is None
+        assert task.basename == "file.txt"
         assert task.start_time > 0
         assert task.downloaded_bytes == 0
         assert task.total_bytes == 0
         assert task.status == "queued"
         assert task.error is None
-        assert task.last_progress_update == 0
+        assert task.total_mb_str is None
 
-    def test_download_task_with_progress_message(self):
-        """Test DownloadTask initialization with progress message."""
-        file_message = Mock()
-        progress_message = Mock()
-        task = DownloadTask("123456", file_message, "/test/path/file.txt", progress_message)
-        
-        assert task.progress_message == progress_message
+    def test_download_task_uses_slots(self):
+        """Test that DownloadTask stores its fields in slots."""
+        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
 
-    def test_download_task_thread_safety(self):
-        """Test that DownloadTask has thread safety with progress_lock."""
-        file_message = Mock()
-        task = DownloadTask("123456", file_message, "/test/path/file.txt")
-        
-        assert hasattr(task, 'progress_lock')
-        assert task.progress_lock is not None
+        assert not hasattr(task, "__dict__")
+        with pytest.raises(AttributeError):
+            task.unknown_field = 1
+
+
+class TestRetryGuard:
+    """Test cases for the RetryGuard class."""
+
+    def test_allows_retries_until_window_is_full(self):
+        """Test that failures short of a full window never trip the guard."""
+        guard = RetryGuard(window=4, failure_rate=0.5, cooldown=60)
+        for _ in range(3):
+            guard.record_result(False)
+        assert guard.should_retry()
+
+    def test_trips_on_high_failure_rate(self):
+        """Test that a mostly failing window disables retries for the cool-down."""
+        guard = RetryGuard(window=4, failure_rate=0.5, cooldown=60)
+        for ok in (True, False, False, False):
+            guard.record_result(ok)
+        assert not guard.should_retry()
+        # Still blocked even though the window was reset
+        guard.record_result(True)
+        assert not guard.should_retry()
+
+    def test_recovers_after_cooldown(self):
+        """Test that retries resume once the cool-down has passed."""
+        guard = RetryGuard(window=2, failure_rate=0.5, cooldown=0)
+        guard.record_result(False)
+        guard.record_result(False)
+        assert not guard.should_retry()
+        assert guard.should_retry()
+
+    def test_tolerates_low_failure_rate(self):
+        """Test that occasional failures keep retries enabled."""
+        guard = RetryGuard(window=4, failure_rate=0.5, cooldown=60)
+        for ok in (True, True, True, False):
+            guard.record_result(ok)
+        assert guard.should_retry()
+
+
+class TestFormatActiveDownloads:
+    """Test cases for the format_active_downloads function."""
+
+    def test_formats_only_the_limit_from_active_set(self):
+        """Test that the live active set is rendered up to the limit without copying it."""
+        active = {
+            DownloadTask("123456", Mock(), f"/test/path/file{i}.txt"): None
+            for i in range(7)
+        }
+
+        text = format_active_downloads(active, limit=5)
+
+        assert text.count("Waiting in queue") == 5
+        assert "file4.txt" in text and "file5.txt" not in text
+        assert text.endswith("... and 2 more downloads\n")
 
 
 class TestDownloadManager:
@@ -50,20 +119,21 @@ class TestDownloadManager:
     def test_download_manager_initialization(self):
         """Test DownloadManager initialization."""
         manager = DownloadManager()
-        
+
         assert manager.download_queue == {}
         assert manager.download_progress == {}
         assert manager.notification_cooldowns == {}
-        assert manager.download_executor is not None
 
     @pytest.mark.asyncio
     async def test_queue_download_new_user(self):
         """Test queuing download for a new user."""
         manager = DownloadManager()
         file_message = Mock()
-        
-        task = await manager.queue_download("123456", file_message, "/test/path/file.txt")
-        
+
+        task = await manager.queue_download(
+            "123456", file_message, "/test/path/file.txt"
+        )
+
         assert task.user_id == "123456"
         assert task.file_message == file_message
         assert task.save_path == "/test/path/file.txt"
@@ -77,10 +147,14 @@ class TestDownloadManager:
         manager = DownloadManager()
         file_message1 = Mock()
         file_message2 = Mock()
-        
-        task1 = await manager.queue_download("123456", file_message1, "/test/path/file1.txt")
-        task2 = await manager.queue_download("123456", file_message2, "/test/path/file2.txt")
-        
+
+        task1 = await manager.queue_download(
+            "123456", file_message1, "/test/path/file1.txt"
+        )
+        task2 = await manager.queue_download(
+            "123456", file_message2, "/test/path/file2.txt"
+        )
+
         assert len(manager.download_queue["123456"]) == 2
         assert task1 in manager.download_queue["123456"]
         assert task2 in manager.download_queue["123456"]
@@ -90,10 +164,10 @@ class TestDownloadManager:
         """Test getting downloads for an existing user."""
         manager = DownloadManager()
         file_message = Mock()
-        
+
         await manager.queue_download("123456", file_message, "/test/path/file.txt")
         downloads = manager.get_user_downloads("123456")
-        
+
         assert len(downloads) == 1
         assert downloads[0].user_id == "123456"
 
@@ -101,7 +175,7 @@ class TestDownloadManager:
         """Test getting downloads for a nonexistent user."""
         manager = DownloadManager()
         downloads = manager.get_user_downloads("nonexistent")
-        
+
         assert downloads == []
 
     @pytest.mark.asyncio
@@ -110,36 +184,142 @@ class TestDownloadManager:
         manager = DownloadManager()
         file_message1 = Mock()
         file_message2 = Mock()
-        
-        task1 = await manager.queue_download("123456", file_message1, "/test/path/file1.txt")
-        task2 = await manager.queue_download("123456", file_message2, "/test/path/file2.txt")
-        
+
+        task1 = await manager.queue_download(
+            "123456", file_message1, "/test/path/file1.txt"
+        )
+        task2 = await manager.queue_download(
+            "123456", file_message2, "/test/path/file2.txt"
+        )
+
         # Mark one task as completed
         task1.status = "completed"
-        
+
         cleared_count = manager.clear_completed_downloads("123456")
-        
+
         assert cleared_count == 1
         assert len(manager.download_queue["123456"]) == 1
         assert task2 in manager.download_queue["123456"]
 
+    @pytest.mark.asyncio
+    async def test_user_stats_track_task_changes(self):
+        """Test that per-user counters follow task status and byte changes."""
+        manager = DownloadManager()
+
+        task1 = await manager.queue_download("123456", Mock(), "/test/path/file1.txt")
+        task2 = await manager.queue_download("123456", Mock(), "/test/path/file2.txt")
+        stats = manager.get_user_stats("123456")
+
+        assert stats.queued == 2
+        assert list(stats.active) == [task1, task2]
+
+        task1.status = "downloading"
+        task1.total_bytes = 100
+        task1.downloaded_bytes = 40
+
+        assert stats.queued == 1
+        assert stats.downloading == 1
+        assert stats.bytes_downloaded == 40
+        assert stats.bytes_total == 100
+
+        task1.status = "completed"
+
+        assert stats.downloading == 0
+        assert stats.completed == 1
+        assert stats.bytes_downloaded == 0
+        assert stats.bytes_total == 0
+        assert list(stats.active) == [task2]
+
+        manager.clear_completed_downloads("123456")
+
+        assert stats.completed == 0
+        assert stats.queued == 1
+
+    @pytest.mark.asyncio
+    async def test_purge_completed_downloads_drops_expired(self):
+        """Test that the purger drops only downloads completed before the TTL."""
+        import asyncio
+
+        manager = DownloadManager()
+
+        with patch(
+            "src.downloads.download_manager.COMPLETED_PURGE_INTERVAL", 0
+        ), patch.object(manager, "download_with_progress", new_callable=AsyncMock):
+            old_task = await manager.queue_download(
+                "123456", Mock(), "/test/path/old.txt"
+            )
+            recent_task = await manager.queue_download(
+                "123456", Mock(), "/test/path/recent.txt"
+            )
+            queued_task = await manager.queue_download(
+                "123456", Mock(), "/test/path/queued.txt"
+            )
+            for task in (old_task, recent_task):
+                task.status = "completed"
+            old_task.completed_at = time.monotonic() - 7200
+            recent_task.completed_at = time.monotonic()
+            queued_task.status = "queued"
+
+            await asyncio.sleep(0.01)
+            manager.completed_purger.cancel()
+
+        assert list(manager.download_queue["123456"]) == [recent_task, queued_task]
+        assert manager.get_user_stats("123456").completed == 1
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_background_tasks(self):
+        """Test that stop cancels the purger and progress refresher."""
+        manager = DownloadManager()
+
+        with patch.object(manager, "download_with_progress", new_callable=AsyncMock):
+            await manager.queue_download("123456", Mock(), "/test/path/file.txt")
+        manager.track_progress("123456")
+        purger, refresher = manager.completed_purger, manager.progress_refresher
+
+        await manager.stop()
+
+        assert purger.cancelled() and refresher.cancelled()
+        assert manager.completed_purger is None and manager.progress_refresher is None
+
+    @pytest.mark.asyncio
+    async def test_purge_completed_downloads_drops_idle_user_stats(self):
+        """Test that a user whose queue is purged empty loses their counters too."""
+        import asyncio
+
+        manager = DownloadManager()
+
+        with patch(
+            "src.downloads.download_manager.COMPLETED_PURGE_INTERVAL", 0
+        ), patch.object(manager, "download_with_progress", new_callable=AsyncMock):
+            task = await manager.queue_download("123456", Mock(), "/test/path/old.txt")
+            task.status = "completed"
+            task.completed_at = time.monotonic() - 7200
+
+            await asyncio.sleep(0.01)
+
+        assert "123456" not in manager.download_queue
+        assert "123456" not in manager.user_stats
+
     @pytest.mark.asyncio
     async def test_clear_completed_downloads_no_completed(self):
         """Test clearing completed downloads when none exist."""
         manager = DownloadManager()
         file_message = Mock()
-        
+
         await manager.queue_download("123456", file_message, "/test/path/file.txt")
+        user_downloads = manager.download_queue["123456"]
         cleared_count = manager.clear_completed_downloads("123456")
-        
+
         assert cleared_count == 0
         assert len(manager.download_queue["123456"]) == 1
+        # The queue is left untouched rather than rebuilt
+        assert manager.download_queue["123456"] is user_downloads
 
     def test_clear_completed_downloads_nonexistent_user(self):
         """Test clearing completed downloads for nonexistent user."""
         manager = DownloadManager()
         cleared_count = manager.clear_completed_downloads("nonexistent")
-        
+
         assert cleared_count == 0
 
     @pytest.mark.asyncio
@@ -148,283 +328,885 @@ class TestDownloadManager:
         manager = DownloadManager()
         file_message1 = Mock()
         file_message2 = Mock()
-        
-        task1 = await manager.queue_download("123456", file_message1, "/test/path/file1.txt")
-        task2 = await manager.queue_download("123456", file_message2, "/test/path/file2.txt")
-        
+
+        task1 = await manager.queue_download(
+            "123456", file_message1, "/test/path/file1.txt"
+        )
+        task2 = await manager.queue_download(
+            "123456", file_message2, "/test/path/file2.txt"
+        )
+
         # Mark tasks as failed
         task1.status = "failed"
         task2.status = "failed"
         task1.error = "Network error"
         task2.error = "Permission error"
-        
+
         retry_count = manager.retry_failed_downloads("123456")
-        
+
         assert retry_count == 2
         assert task1.status == "queued"
         assert task2.status == "queued"
         assert task1.error is None
         assert task2.error is None
 
+    @pytest.mark.asyncio
+    async def test_retry_failed_downloads_bounded_concurrency(self):
+        """Test that retried downloads run through the bounded worker pool."""
+        import asyncio
+        from dataclasses import replace
+        from src.downloads.download_manager import config
+
+        manager = DownloadManager()
+        running = 0
+        max_running = 0
+
+        async def fake_download(task):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for i in range(4):
+            task = DownloadTask("123456", Mock(), f"/test/path/file{i}.txt")
+            task.status = "failed"
+            manager.download_queue.setdefault("123456", []).append(task)
+
+        with patch(
+            "src.downloads.download_manager.config",
+            replace(config, max_concurrent_downloads=2),
+        ), patch.object(manager, "download_with_progress", side_effect=fake_download):
+            retry_count = manager.retry_failed_downloads("123456")
+            await asyncio.sleep(0.1)
+
+        assert retry_count == 4
+        assert max_running == 2
+
+    @pytest.mark.asyncio
+    async def test_download_queued_during_another_starts_immediately(self):
+        """Test that a file queued while another downloads gets its own worker."""
+        import asyncio
+
+        manager = DownloadManager()
+        started = []
+        release = asyncio.Event()
+
+        async def fake_download(task):
+            started.append(task.save_path)
+            await release.wait()
+
+        with patch.object(
+            manager, "download_with_progress", side_effect=fake_download
+        ), patch.object(manager, "start_completed_purger"):
+            await manager.queue_download("123456", Mock(), "/tmp/a")
+            await asyncio.sleep(0)
+            await manager.queue_download("123456", Mock(), "/tmp/b")
+            await asyncio.sleep(0.01)
+
+            # The second file runs alongside the first rather than after it
+            assert started == ["/tmp/a", "/tmp/b"]
+            release.set()
+            await asyncio.gather(*manager.download_workers)
+
+        assert manager.busy_workers == 0
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
+    async def test_retried_download_that_fails_again_notifies_again(self, mock_client):
+        """Test that a retry that fails again reports its failure, without a per-download message."""
+        manager = DownloadManager()
+        task = DownloadTask("777", Mock(media=None), "/test/path/file.txt")
+
+        with patch.object(
+            manager, "fetch_with_backoff", new_callable=AsyncMock, return_value=None
+        ), patch.object(
+            manager, "send_notification", new_callable=AsyncMock
+        ) as mock_notify, patch.object(
+            manager, "start_download_workers"
+        ):
+            await manager.download_with_progress(task)
+            manager.user_stats["777"] = task.stats = UserDownloadStats()
+            task.stats.add(task)
+            manager.download_queue["777"] = [task]
+            assert manager.retry_failed_downloads("777") == 1
+            await manager.download_with_progress(task)
+
+        assert task.status == "failed"
+        assert mock_notify.await_count == 2
+        assert all("file.txt" in call.args[1] for call in mock_notify.await_args_list)
+        mock_client.send_message.assert_not_called()
+
     @pytest.mark.asyncio
     async def test_retry_failed_downloads_no_failed(self):
         """Test retrying failed downloads when none exist."""
         manager = DownloadManager()
         file_message = Mock()
-        
+
         await manager.queue_download("123456", file_message, "/test/path/file.txt")
+        user_downloads = manager.download_queue["123456"] = MagicMock(
+            wraps=manager.download_queue["123456"]
+        )
         retry_count = manager.retry_failed_downloads("123456")
-        
+
         assert retry_count == 0
+        # The failed counter answers without scanning the queue
+        user_downloads.__iter__.assert_not_called()
 
     def test_retry_failed_downloads_nonexistent_user(self):
         """Test retrying failed downloads for nonexistent user."""
         manager = DownloadManager()
         retry_count = manager.retry_failed_downloads("nonexistent")
-        
+
         assert retry_count == 0
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
+    @patch("src.bot.client.client")
     async def test_send_notification_management_command(self, mock_client):
         """Test sending notification for management command."""
         manager = DownloadManager()
         mock_client.send_message = AsyncMock()
-        
+
         # Set up user state with chat_id - use the one from download_manager
         from src.downloads.download_manager import user_state
+
         user_state.set_chat_id("123456", 123456789)
-        
-        await manager.send_notification("123456", "Test message", is_management_command=True)
-        
+
+        await manager.send_notification(
+            "123456", "Test message", is_management_command=True
+        )
+
         mock_client.send_message.assert_called_once()
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
+    @patch("src.bot.client.client")
     async def test_send_notification_rate_limited(self, mock_client):
         """Test that notifications are rate limited."""
         manager = DownloadManager()
         mock_client.send_message = AsyncMock()
-        
+
         # Set up user state with chat_id - use the one from download_manager
         from src.downloads.download_manager import user_state
+
         user_state.set_chat_id("123456", 123456789)
-        
+
         # Set up rate limiting
-        manager.notification_cooldowns["123456"] = time.time()
-        
-        await manager.send_notification("123456", "Test message", is_management_command=False)
-        
-        # Should not call send_message due to rate limiting
+        manager.notification_cooldowns["123456"] = time.monotonic_ns() + 30_000_000_000
+
+        await manager.send_notification(
+            "123456", "Test message", is_management_command=False
+        )
+
+        # Should not call send_message due to rate limiting, but keep the message for later
+        mock_client.send_message.assert_not_called()
+        assert manager.pending_notifications["123456"] == ["Test message"]
+        manager.notification_senders["123456"].cancel()
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
+    async def test_deferred_notifications_are_batched(self, mock_client):
+        """Test that notifications held back by the cooldown go out as one message when it ends."""
+        manager = DownloadManager()
+        mock_client.send_message = AsyncMock()
+
+        from src.downloads.download_manager import user_state
+
+        user_state.set_chat_id("123456", 123456789)
+
+        manager.notification_cooldowns["123456"] = time.monotonic_ns() + 20_000_000
+        await manager.send_notification("123456", "First")
+        await manager.send_notification("123456", "Second")
         mock_client.send_message.assert_not_called()
 
+        await manager.notification_senders["123456"]
+
+        mock_client.send_message.assert_awaited_once_with(123456789, "First\n\nSecond")
+        assert "123456" not in manager.pending_notifications
+        assert "123456" not in manager.notification_senders
+        assert manager.notification_cooldowns["123456"] > time.monotonic_ns()
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
+    async def test_deferred_notifications_respect_message_limit(self, mock_client):
+        """Test that a batch never exceeds Telegram's message length."""
+        manager = DownloadManager()
+        mock_client.send_message = AsyncMock()
+
+        from src.downloads.download_manager import user_state
+
+        user_state.set_chat_id("123456", 123456789)
+
+        manager.pending_notifications["123456"] = ["a" * 3000, "b" * 3000]
+        with patch("src.downloads.download_manager.config") as mock_config:
+            mock_config.notification_cooldown = 0
+            await manager.flush_notifications("123456")
+
+        assert [call.args[1] for call in mock_client.send_message.await_args_list] == [
+            "a" * 3000,
+            "b" * 3000,
+        ]
+
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
+    @patch("src.bot.client.client")
+    async def test_notification_cooldowns_are_bounded(self, mock_client):
+        """Test that the oldest notification cooldown is evicted at capacity."""
+        manager = DownloadManager()
+        mock_client.send_message = AsyncMock()
+
+        from src.downloads.download_manager import user_state
+
+        for user_id in ("1", "2", "3"):
+            user_state.set_chat_id(user_id, 123456789)
+
+        with patch("src.downloads.download_manager.MAX_NOTIFICATION_COOLDOWNS", 2):
+            for user_id in ("1", "2", "3"):
+                await manager.send_notification(user_id, "Test message")
+
+        assert list(manager.notification_cooldowns) == ["2", "3"]
+        assert manager.notification_cooldowns["3"] > time.monotonic_ns()
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
     async def test_send_notification_no_chat_id(self, mock_client):
         """Test sending notification when no chat_id is available."""
         manager = DownloadManager()
         mock_client.send_message = AsyncMock()
-        
+
         # Clear user state to ensure no chat_id is set
         from src.downloads.download_manager import user_state
+
         user_state.clear_user_state("123456")
-        
-        await manager.send_notification("123456", "Test message", is_management_command=True)
-        
+
+        await manager.send_notification(
+            "123456", "Test message", is_management_command=True
+        )
+
         # Should not call send_message when no chat_id
         mock_client.send_message.assert_not_called()
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
+    @patch("src.bot.client.client")
     async def test_send_notification_exception_handling(self, mock_client):
         """Test exception handling in send_notification."""
         manager = DownloadManager()
         mock_client.send_message.side_effect = Exception("Network error")
-        
+
         # Set up user state with chat_id - use the one from download_manager
         from src.downloads.download_manager import user_state
+
         user_state.set_chat_id("123456", 123456789)
-        
+
         # Should not raise exception
-        await manager.send_notification("123456", "Test message", is_management_command=True)
+        await manager.send_notification(
+            "123456", "Test message", is_management_command=True
+        )
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
-    async def test_update_progress_message_success(self, mock_client):
-        """Test successful progress message update."""
+    @patch("src.bot.client.client")
+    async def test_download_with_progress_success(self, mock_client):
+        """Test successful download with progress."""
         manager = DownloadManager()
-        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
-        task.progress_message = Mock()
-        task.progress_message.edit = AsyncMock()
-        
-        await manager.update_progress_message(task, "Progress: 50%")
-        
-        task.progress_message.edit.assert_called_once_with("Progress: 50%")
+        file_message = Mock()
+        file_message.media.document.size = 1024000
+
+        task = DownloadTask("123456", file_message, "/test/path/file.txt")
+        mock_client.send_message = AsyncMock(return_value=Mock())
+        mock_client.download_media = AsyncMock(return_value="/test/path/file.txt")
+
+        # Set up user state with chat_id - use the one from download_manager
+        from src.downloads.download_manager import user_state
+
+        user_state.set_chat_id("123456", 123456789)
+
+        await manager.download_with_progress(task)
+
+        assert task.status == "completed"
+        assert task.total_bytes == 1024000
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
-    async def test_update_progress_message_message_not_modified(self, mock_client):
-        """Test progress message update with MessageNotModifiedError."""
-        from telethon.errors import MessageNotModifiedError
-        
+    @patch("src.bot.client.client")
+    async def test_download_with_progress_callbacks_only_record(self, mock_client):
+        """Test that downloads send no message of their own besides the completion notification."""
         manager = DownloadManager()
-        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
-        task.progress_message = Mock()
-        task.progress_message.edit = AsyncMock(side_effect=MessageNotModifiedError(request=Mock()))
-        
-        # Should not raise exception
-        await manager.update_progress_message(task, "Progress: 50%")
+        file_message = Mock()
+        file_message.media.document.size = 1024000
+
+        task = DownloadTask("123456", file_message, "/test/path/file.txt")
+
+        async def fake_download(media, path, progress_callback):
+            for received in range(1000, 11000, 1000):
+                progress_callback(received, 1024000)
+            return path
+
+        mock_client.send_message = AsyncMock(return_value=Mock())
+        mock_client.download_media = AsyncMock(side_effect=fake_download)
+
+        from src.downloads.download_manager import user_state
+
+        user_state.set_chat_id("123456", 123456789)
+
+        with patch.object(
+            manager, "send_notification", new_callable=AsyncMock
+        ) as mock_notify:
+            await manager.download_with_progress(task)
+        manager.progress_refresher.cancel()
+
+        mock_client.send_message.assert_not_called()
+        mock_notify.assert_awaited_once()
+        assert "Download Complete" in mock_notify.call_args.args[1]
+        assert task.downloaded_bytes == 10000
+        assert "123456" in manager.progress_messages
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
-    async def test_update_progress_message_rate_limit(self, mock_client):
-        """Test progress message update with rate limit error."""
+    @patch("src.bot.client.client")
+    async def test_update_user_progress_sends_then_edits(self, mock_client):
+        """Test that a user's active downloads share one progress message."""
         manager = DownloadManager()
-        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
-        task.progress_message = Mock()
-        task.progress_message.edit = AsyncMock(side_effect=Exception("wait of 30 seconds is required"))
-        
-        # Should not raise exception
-        await manager.update_progress_message(task, "Progress: 50%")
+        task1 = await manager.queue_download("123456", Mock(), "/test/path/file1.txt")
+        task2 = await manager.queue_download("123456", Mock(), "/test/path/file2.txt")
+        task1.status = "downloading"
+        task1.total_bytes = 2 * 1024 * 1024
+        task1.downloaded_bytes = 1024 * 1024
+
+        progress_message = Mock(input_chat=None)
+        progress_message.edit = AsyncMock()
+        mock_client.send_message = AsyncMock(return_value=progress_message)
+        from src.downloads.download_manager import user_state
+
+        user_state.set_chat_id("123456", 123456789)
+        manager.progress_messages["123456"] = None
+
+        with patch("time.monotonic", return_value=task1.start_time + 10):
+            await manager.update_user_progress("123456")
+            task1.downloaded_bytes = 1536 * 1024
+            await manager.update_user_progress("123456")
+            # Unchanged progress is not edited again
+            await manager.update_user_progress("123456")
+
+        mock_client.send_message.assert_called_once()
+        text = mock_client.send_message.call_args[0][1]
+        assert "file1.txt" in text and "file2.txt" in text
+        assert "Downloaded: 1.0 MB / 2.0 MB" in text
+        progress_message.edit.assert_called_once()
+        assert "Downloaded: 1.5 MB / 2.0 MB" in progress_message.edit.call_args[0][0]
+
+        task1.status = "completed"
+        task2.status = "failed"
+        await manager.update_user_progress("123456")
+
+        assert "123456" not in manager.progress_messages
+        # The message is closed out rather than left at its last percentage
+        assert progress_message.edit.call_count == 2
+        assert progress_message.edit.call_args[0][0] == DOWNLOADS_FINISHED_TEXT
+
+        # Later ticks for the user neither edit nor send again
+        await manager.update_user_progress("123456")
+        assert progress_message.edit.call_count == 2
+        mock_client.send_message.assert_called_once()
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
-    async def test_update_progress_message_no_progress_message(self, mock_client):
-        """Test progress message update when no progress message exists."""
+    @patch("src.bot.client.client")
+    async def test_update_user_progress_waits_out_flood_wait(self, mock_client):
+        """Test that edits skip the full flood wait and a final edit is sent after it."""
+        from telethon.errors import FloodWaitError
+
         manager = DownloadManager()
-        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
-        task.progress_message = None
-        
-        # Should not raise exception
-        await manager.update_progress_message(task, "Progress: 50%")
+        task = DownloadTask("123456", Mock(), "/test/path/file1.txt")
+        manager.user_stats["123456"] = task.stats = UserDownloadStats()
+        task.stats.add(task)
+        progress_message = Mock(input_chat=None)
+        progress_message.edit = AsyncMock(
+            side_effect=FloodWaitError(request=Mock(), capture=30)
+        )
+        manager.progress_messages["123456"] = progress_message
+
+        now = time.monotonic()
+        with patch("time.monotonic", return_value=now):
+            await manager.update_user_progress("123456")
+        progress_message.edit.side_effect = None
+        task.status = "completed"
+
+        # The final edit is held back for the whole wait, but the user stays tracked
+        with patch("time.monotonic", return_value=now + 29):
+            await manager.update_user_progress("123456")
+        assert progress_message.edit.await_count == 1
+        assert "123456" in manager.progress_messages
+
+        with patch("time.monotonic", return_value=now + 31):
+            await manager.update_user_progress("123456")
+        assert progress_message.edit.await_count == 2
+        assert progress_message.edit.call_args[0][0] == DOWNLOADS_FINISHED_TEXT
+        assert "123456" not in manager.progress_messages
+        assert "123456" not in manager.progress_resume_at
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
-    async def test_update_progress_message_throttling(self, mock_client):
-        """Test that progress message updates are throttled."""
+    @patch("src.bot.client.client", new_callable=AsyncMock)
+    async def test_update_user_progress_edits_through_message_peer(self, mock_client):
+        """Test that the per-tick aggregated edit goes to the chat the message was sent to."""
+        from telethon.tl.functions.messages import EditMessageRequest
+        from telethon.tl.types import InputPeerChat, MessageEntityBold
+        from src.downloads.download_manager import user_state
+
         manager = DownloadManager()
-        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
-        task.progress_message = Mock()
-        task.progress_message.edit = AsyncMock()
-        task.last_progress_update = time.time()
-        
-        await manager.update_progress_message(task, "Progress: 50%")
-        
-        # Should not call edit due to throttling
-        task.progress_message.edit.assert_not_called()
+        task = DownloadTask("654321", Mock(), "/test/path/file1.txt")
+        manager.user_stats["654321"] = task.stats = UserDownloadStats()
+        task.stats.add(task)
+        # Sent to a group, while the user's current chat has since moved elsewhere
+        input_peer = InputPeerChat(chat_id=777)
+        progress_message = Mock(id=42, input_chat=input_peer)
+        progress_message.edit = AsyncMock()
+        manager.progress_messages["654321"] = progress_message
+        user_state.set_chat_id("654321", 654321)
+
+        try:
+            await manager.update_user_progress("654321")
+        finally:
+            user_state.clear_user_state("654321")
+
+        request = mock_client.call_args[0][0]
+        assert isinstance(request, EditMessageRequest)
+        assert request.peer == input_peer and request.id == 42
+        # Markdown is sent as entities rather than literal asterisks
+        assert "**" not in request.message and "file1.txt" in request.message
+        assert any(isinstance(entity, MessageEntityBold) for entity in request.entities)
+        progress_message.edit.assert_not_called()
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
-    async def test_download_with_progress_success(self, mock_client):
-        """Test successful download with progress."""
+    async def test_refresh_progress_messages_updates_users_concurrently(self):
+        """Test that one refresh tick edits every tracked user's message at the same time."""
+        import asyncio
+        from dataclasses import replace
+        from src.downloads import download_manager as dm
+
         manager = DownloadManager()
-        file_message = Mock()
-        file_message.media.document.size = 1024000
-        
-        task = DownloadTask("123456", file_message, "/test/path/file.txt")
-        mock_client.send_message = AsyncMock(return_value=Mock())
-        mock_client.download_media = AsyncMock(return_value="/test/path/file.txt")
-        
-        # Set up user state with chat_id - use the one from download_manager
-        from src.downloads.download_manager import user_state
-        user_state.set_chat_id("123456", 123456789)
-        
-        await manager.download_with_progress(task)
-        
-        assert task.status == "completed"
-        assert task.total_bytes == 1024000
+        manager.progress_messages = {"111": None, "222": None}
+        running = 0
+        max_running = 0
+
+        async def fake_update(user_id):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            manager.progress_messages.pop(user_id, None)
+
+        with patch(
+            "src.downloads.download_manager.config",
+            replace(dm.config, progress_update_interval=0),
+        ), patch.object(manager, "update_user_progress", side_effect=fake_update):
+            await manager.refresh_progress_messages()
+
+        assert max_running == 2
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
+    @patch("src.bot.client.client")
     async def test_download_with_progress_failure(self, mock_client):
         """Test download failure."""
         manager = DownloadManager()
         file_message = Mock()
         file_message.media.document.size = 1024000
-        
+
         task = DownloadTask("123456", file_message, "/test/path/file.txt")
         mock_client.send_message = AsyncMock(return_value=Mock())
         mock_client.download_media = AsyncMock(return_value=None)
-        
+
         # Set up user state with chat_id - use the one from download_manager
         from src.downloads.download_manager import user_state
+
         user_state.set_chat_id("123456", 123456789)
-        
-        await manager.download_with_progress(task)
-        
+
+        with patch.object(
+            manager, "send_notification", new_callable=AsyncMock
+        ) as mock_notify:
+            await manager.download_with_progress(task)
+
         assert task.status == "failed"
         assert task.error == "Download failed"
+        mock_notify.assert_awaited_once_with(
+            "123456",
+            "❌ **Download Failed!**\n\n"
+            "📁 **File:** file.txt\n"
+            "🔍 **Error:** Download failed\n\n"
+            "Use /status to retry failed downloads.",
+        )
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
+    @patch("src.bot.client.client")
     async def test_download_with_progress_exception(self, mock_client):
         """Test download with exception."""
         manager = DownloadManager()
         file_message = Mock()
         file_message.media.document.size = 1024000
-        
+
         task = DownloadTask("123456", file_message, "/test/path/file.txt")
         mock_client.send_message = AsyncMock(return_value=Mock())
         mock_client.download_media = AsyncMock(side_effect=Exception("Network error"))
-        
+
         # Set up user state with chat_id - use the one from download_manager
         from src.downloads.download_manager import user_state
+
         user_state.set_chat_id("123456", 123456789)
-        
+
         await manager.download_with_progress(task)
-        
+
         assert task.status == "failed"
         assert task.error == "Network error"
 
     @pytest.mark.asyncio
-    @patch('src.bot.client.client')
+    @patch("src.downloads.download_manager.asyncio.sleep", new_callable=AsyncMock)
+    @patch("src.bot.client.client")
+    async def test_fetch_with_backoff_retries_dropped_connection(
+        self, mock_client, mock_sleep
+    ):
+        """Test that a dropped connection is retried after a bounded backoff sleep."""
+        from src.downloads.download_manager import config
+
+        manager = DownloadManager()
+        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
+        mock_client.download_media = AsyncMock(
+            side_effect=[ConnectionError("reset"), "/test/path/file.txt"]
+        )
+
+        result = await manager.fetch_with_backoff(task, Mock())
+
+        assert result == "/test/path/file.txt"
+        assert mock_client.download_media.await_count == 2
+        mock_sleep.assert_awaited_once()
+        assert 0 <= mock_sleep.await_args.args[0] <= config.retry_backoff_cap
+
+    @pytest.mark.asyncio
+    @patch("src.downloads.download_manager.asyncio.sleep", new_callable=AsyncMock)
+    @patch("src.bot.client.client")
+    async def test_fetch_with_backoff_gives_up(self, mock_client, mock_sleep):
+        """Test that the error is raised once the retries are exhausted."""
+        from src.downloads.download_manager import config
+
+        manager = DownloadManager()
+        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
+        mock_client.download_media = AsyncMock(side_effect=ConnectionError("reset"))
+
+        with pytest.raises(ConnectionError):
+            await manager.fetch_with_backoff(task, Mock())
+
+        assert mock_client.download_media.await_count == config.download_retries + 1
+        assert mock_sleep.await_count == config.download_retries
+
+    @pytest.mark.asyncio
+    @patch("src.downloads.download_manager.asyncio.sleep", new_callable=AsyncMock)
+    @patch("src.bot.client.client")
+    async def test_fetch_with_backoff_respects_retry_guard(
+        self, mock_client, mock_sleep
+    ):
+        """Test that a tripped retry guard fails the download without retrying."""
+        manager = DownloadManager()
+        manager.retry_guard = RetryGuard(window=1, failure_rate=0.5, cooldown=60)
+        task = DownloadTask("123456", Mock(), "/test/path/file.txt")
+        mock_client.download_media = AsyncMock(side_effect=ConnectionError("reset"))
+
+        with pytest.raises(ConnectionError):
+            await manager.fetch_with_backoff(task, Mock())
+
+        assert mock_client.download_media.await_count == 1
+        mock_sleep.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
+    async def test_fetch_with_backoff_refreshes_expired_file_reference(
+        self, mock_client
+    ):
+        """Test that an expired file reference re-fetches the message and downloads from the fresh copy."""
+        from telethon.errors import FileReferenceExpiredError
+
+        stale = Mock(chat_id=123456789, id=42)
+        fresh = Mock(chat_id=123456789, id=42)
+        mock_client.get_messages = AsyncMock(return_value=fresh)
+        manager = DownloadManager()
+        task = DownloadTask("123456", stale, "/test/path/file.txt")
+        fetched_from = []
+
+        async def fake_fetch_media(task, progress_callback):
+            fetched_from.append(task.file_message)
+            if task.file_message is stale:
+                raise FileReferenceExpiredError(request=Mock())
+            return task.save_path
+
+        with patch.object(manager, "fetch_media", side_effect=fake_fetch_media):
+            assert (
+                await manager.fetch_with_backoff(task, Mock()) == "/test/path/file.txt"
+            )
+
+        mock_client.get_messages.assert_awaited_once_with(123456789, ids=42)
+        assert fetched_from == [stale, fresh]
+
+        # A reference that keeps expiring is refreshed only once
+        mock_client.get_messages = AsyncMock(return_value=stale)
+        task.file_message = stale
+        with patch.object(manager, "fetch_media", side_effect=fake_fetch_media):
+            with pytest.raises(FileReferenceExpiredError):
+                await manager.fetch_with_backoff(task, Mock())
+        mock_client.get_messages.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    @patch("src.downloads.download_manager.asyncio.sleep", new_callable=AsyncMock)
+    @patch("src.bot.client.client")
+    async def test_fetch_with_backoff_adapts_request_size(
+        self, mock_client, mock_sleep, temp_dir
+    ):
+        """Test that failures halve the size passed to iter_download and clean fetches grow it back."""
+        import os
+        from telethon.tl.types import MessageMediaDocument
+        from src.downloads.download_manager import config
+
+        requested = []
+
+        async def fake_iter_download(media, request_size):
+            requested.append(request_size)
+            if len(requested) == 1:
+                raise ConnectionError("reset")
+            yield b"data"
+
+        mock_client.iter_download = fake_iter_download
+        file_message = Mock()
+        file_message.media = MessageMediaDocument(document=Mock(size=4))
+        manager = DownloadManager()
+        task = DownloadTask("123456", file_message, os.path.join(temp_dir, "file.bin"))
+        task.total_bytes = 4
+
+        await manager.fetch_with_backoff(task, Mock())
+        assert requested == [
+            config.download_chunk_size,
+            config.download_chunk_size // 2,
+        ]
+
+        for _ in range(config.chunk_growth_successes):
+            await manager.fetch_with_backoff(task, Mock())
+        assert requested[-1] == config.download_chunk_size
+        # Telethon clamps anything larger, so the adaptive range stays within its maximum
+        assert max(requested) <= 512 * 1024
+
+        # Never shrinks below the floor
+        for _ in range(10):
+            manager.shrink_request_size()
+        assert manager.request_size == config.min_download_chunk_size
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
     async def test_download_with_progress_no_chat_id(self, mock_client):
         """Test download when no chat_id is available."""
         manager = DownloadManager()
         file_message = Mock()
         file_message.media.document.size = 1024000
-        
+
         task = DownloadTask("123456", file_message, "/test/path/file.txt")
-        
+
         await manager.download_with_progress(task)
-        
+
         # Should handle gracefully without chat_id
         assert task.status == "failed"
 
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
+    async def test_stream_to_file_batches_writes(self, mock_client, temp_dir):
+        """Test that streamed chunks are written to disk in batches through a pooled buffer."""
+        import os
+        from src.downloads import download_manager as dm
+
+        chunks = [b"a" * 10, b"b" * 10, b"c" * 10, b"d" * 5]
+
+        async def fake_iter_download(media, request_size):
+            for chunk in chunks:
+                yield chunk
+
+        mock_client.iter_download = fake_iter_download
+        manager = DownloadManager()
+        save_path = os.path.join(temp_dir, "file.bin")
+        task = DownloadTask("123456", Mock(), save_path)
+        task.total_bytes = 35
+        progress_callback = Mock()
+
+        pooled_buffer = bytearray(20)
+        dm._BUFFER_POOL.clear()
+        dm.release_buffer(pooled_buffer)
+        with patch("os.write", wraps=os.write) as mock_write:
+            result = await manager.stream_to_file(task, progress_callback)
+
+        assert result == save_path
+        assert mock_write.call_count == 2
+        with open(save_path, "rb") as f:
+            assert f.read() == b"".join(chunks)
+        progress_callback.assert_called_with(35, 35)
+        # The buffer goes back to the pool for the next download
+        assert dm.acquire_buffer() is pooled_buffer
+
+    def test_write_buffer_size_splits_the_budget(self):
+        """Test that buffers share the budget across all streams in whole requests, holding at least one."""
+        from dataclasses import replace
+        from src.downloads import download_manager as dm
+
+        base = replace(
+            dm.config,
+            download_chunk_size=512 * 1024,
+            max_concurrent_downloads=1,
+            parallel_parts=4,
+        )
+        with patch(
+            "src.downloads.download_manager.config",
+            replace(base, write_buffer_budget=8 * 1024 * 1024),
+        ):
+            assert dm.write_buffer_size() == 2 * 1024 * 1024
+        # Too small a share still fits one request
+        with patch(
+            "src.downloads.download_manager.config",
+            replace(base, write_buffer_budget=1024),
+        ):
+            assert dm.write_buffer_size() == 512 * 1024
+        # The defaults keep every stream to a single request
+        assert (
+            dm.write_buffer_size()
+            * dm.config.max_concurrent_downloads
+            * dm.config.parallel_parts
+            <= 10 * 1024 * 1024
+        )
+
+    def test_open_for_download_preallocates(self, temp_dir):
+        """Test that download targets are reserved at full size, tolerating unsupported filesystems."""
+        import os
+        from src.downloads.download_manager import _open_for_download
+
+        save_path = os.path.join(temp_dir, "file.bin")
+        fd = _open_for_download(save_path, 4096)
+        os.close(fd)
+        if hasattr(os, "posix_fallocate"):
+            assert os.path.getsize(save_path) == 4096
+
+        with patch(
+            "os.posix_fallocate", side_effect=OSError(95, "Not supported"), create=True
+        ):
+            fd = _open_for_download(save_path, 4096)
+        os.close(fd)
+        assert os.path.getsize(save_path) == 0
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
+    async def test_download_with_progress_fetches_large_documents_in_parts(
+        self, mock_client, temp_dir
+    ):
+        """Test that large documents are fetched as concurrent ranges written at their offsets."""
+        import asyncio
+        import os
+        from collections import deque
+        from dataclasses import replace
+        from telethon.tl.types import MessageMediaDocument
+        from src.downloads import download_manager as dm
+
+        data = bytes(range(26)) * 2
+        requested = []
+
+        async def fake_iter_download(media, offset, limit, request_size):
+            requested.append((offset, limit))
+            for index in range(limit):
+                start = offset + index * request_size
+                if start >= len(data):
+                    break
+                await asyncio.sleep(0)
+                yield data[start : start + request_size]
+
+        file_message = Mock()
+        file_message.media = MessageMediaDocument(document=Mock(size=len(data)))
+        mock_client.iter_download = fake_iter_download
+        mock_client.send_message = AsyncMock(return_value=Mock())
+
+        from src.downloads.download_manager import user_state
+
+        user_state.set_chat_id("123456", 123456789)
+
+        manager = DownloadManager()
+        save_path = os.path.join(temp_dir, "file.bin")
+        task = DownloadTask("123456", file_message, save_path)
+        manager.request_size = 4
+        small = replace(
+            dm.config,
+            download_chunk_size=4,
+            write_buffer_budget=8 * 5 * 3,
+            parallel_parts=3,
+        )
+        with patch("src.downloads.download_manager.config", small), patch(
+            "src.downloads.download_manager._BUFFER_POOL", deque()
+        ):
+            await manager.download_with_progress(task)
+
+        assert task.status == "completed"
+        assert sorted(requested) == [(0, 5), (20, 5), (40, 3)]
+        with open(save_path, "rb") as f:
+            assert f.read() == data
+        assert task.downloaded_bytes == len(data)
+
+    @pytest.mark.asyncio
+    @patch("src.bot.client.client")
+    async def test_download_with_progress_streams_documents(
+        self, mock_client, temp_dir
+    ):
+        """Test that document media is streamed instead of using download_media."""
+        import os
+        from telethon.tl.types import MessageMediaDocument
+
+        async def fake_iter_download(media, request_size):
+            yield b"data"
+
+        file_message = Mock()
+        file_message.media = MessageMediaDocument(document=Mock(size=4))
+        mock_client.iter_download = fake_iter_download
+        mock_client.send_message = AsyncMock(return_value=Mock())
+        mock_client.download_media = AsyncMock()
+
+        from src.downloads.download_manager import user_state
+
+        user_state.set_chat_id("123456", 123456789)
+
+        manager = DownloadManager()
+        task = DownloadTask("123456", file_message, os.path.join(temp_dir, "file.bin"))
+        await manager.download_with_progress(task)
+
+        assert task.status == "completed"
+        mock_client.download_media.assert_not_called()
+
     @pytest.mark.asyncio
     async def test_download_manager_concurrent_downloads(self):
         """Test that download manager supports concurrent downloads."""
         manager = DownloadManager()
-        
+
         # Should be able to queue multiple downloads
         file_messages = [Mock() for _ in range(5)]
-        
+
         for i, file_message in enumerate(file_messages):
-            task = await manager.queue_download(f"user{i}", file_message, f"/test/path/file{i}.txt")
+            task = await manager.queue_download(
+                f"user{i}", file_message, f"/test/path/file{i}.txt"
+            )
             assert task.status == "queued"
 
     def test_download_task_progress_tracking(self):
         """Test that download task properly tracks progress."""
         task = DownloadTask("123456", Mock(), "/test/path/file.txt")
-        
+
         # Simulate progress updates
         task.downloaded_bytes = 512000
         task.total_bytes = 1024000
-        
+
         progress_percent = (task.downloaded_bytes / task.total_bytes) * 100
         assert progress_percent == 50.0
 
     def test_download_task_status_transitions(self):
         """Test download task status transitions."""
         task = DownloadTask("123456", Mock(), "/test/path/file.txt")
-        
+
         assert task.status == "queued"
-        
+
         task.status = "downloading"
         assert task.status == "downloading"
-        
+
         task.status = "completed"
         assert task.status == "completed"
-        
+
         task.status = "failed"
-        assert task.status == "failed" 
\ No newline at end of file
+        assert task.status == "failed"
@@ -0,0 +1,114 @@
+"""
+Unit tests for the message handlers module.
+"""
+
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from telethon.tl.types import (
+    DocumentAttributeAudio,
+    DocumentAttributeFilename,
+    DocumentAttributeVideo,
+    MessageMediaDocument,
+)
+from src.handlers.message_handlers import (
+    document_file_name,
+    handle_logged_in_message,
+    message_handler,
+)
+
+
+class TestDocumentFileName:
+    """Test cases for the document_file_name function."""
+
+    def test_finds_filename_after_video_attribute(self):
+        """Test that a video's name is found even though its video attribute comes first."""
+        media = MessageMediaDocument(
+            document=Mock(
+                attributes=[
+                    DocumentAttributeVideo(duration=10, w=1280, h=720),
+                    DocumentAttributeFilename(file_name="holiday.mp4"),
+                ]
+            )
+        )
+        assert document_file_name(media) == "holiday.mp4"
+
+    def test_returns_none_without_filename_attribute(self):
+        """Test that documents without a filename attribute, and photos, have no name."""
+        media = MessageMediaDocument(
+            document=Mock(attributes=[DocumentAttributeAudio(duration=5)])
+        )
+        assert document_file_name(media) is None
+        assert document_file_name(Mock(spec=[])) is None
+
+
+class TestHandleLoggedInMessage:
+    """Test cases for forwarded files."""
+
+    @pytest.mark.asyncio
+    @patch(
+        "src.handlers.message_handlers.create_directory_keyboard",
+        new_callable=AsyncMock,
+    )
+    async def test_forwarded_video_keeps_its_name(self, mock_keyboard):
+        """Test that a forwarded video is remembered under its original file name."""
+        from src.handlers.message_handlers import user_state
+
+        event = Mock()
+        event.respond = AsyncMock()
+        event.message.media = MessageMediaDocument(
+            document=Mock(
+                attributes=[
+                    DocumentAttributeVideo(duration=10, w=1280, h=720),
+                    DocumentAttributeFilename(file_name="holiday.mp4"),
+                ]
+            )
+        )
+
+        try:
+            await handle_logged_in_message(event, "555")
+            assert user_state.get_user_data("555", "original_filename") == "holiday.mp4"
+            assert user_state.get_state("555") == "selecting_directory"
+        finally:
+            user_state.clear_user_state("555")
+
+
+class TestMessageHandler:
+    """Test cases for routing messages by user state."""
+
+    @pytest.mark.asyncio
+    @patch(
+        "src.handlers.message_handlers.handle_logged_in_message", new_callable=AsyncMock
+    )
+    @patch("src.handlers.message_handlers.config")
+    async def test_file_with_slash_caption_is_not_skipped(
+        self, mock_config, mock_handle
+    ):
+        """Test that a file whose caption starts with "/" still reaches the state machine."""
+        from src.handlers.message_handlers import user_state
+
+        mock_config.allowed_users = {555}
+        event = Mock(sender_id=555, chat_id=555, raw_text="/home/user/notes")
+        event.message.media = MessageMediaDocument(document=Mock(attributes=[]))
+        user_state.set_state("555", "logged_in")
+
+        try:
+            await message_handler(event)
+        finally:
+            user_state.clear_user_state("555")
+
+        mock_handle.assert_awaited_once_with(event, "555")
+
+    @pytest.mark.asyncio
+    @patch(
+        "src.handlers.message_handlers.handle_logged_in_message", new_callable=AsyncMock
+    )
+    @patch("src.handlers.message_handlers.config")
+    async def test_text_command_is_skipped(self, mock_config, mock_handle):
+        """Test that text commands are left to the command handlers."""
+        mock_config.allowed_users = {555}
+        event = Mock(sender_id=555, chat_id=555, raw_text="/status")
+        event.message.media = None
+
+        await message_handler(event)
+
+        mock_handle.assert_not_awaited()
@@ -56,6 +56,29 @@ class TestPathManager:
         
         assert decoded == original_path
 
+    def test_decode_path_uses_reverse_lookup(self):
+        """Test that encoding populates the reverse lookup used by decode_path."""
+        path_manager = PathManager()
+        encoded = path_manager.encode_path("/test/path")
+        
+        assert path_manager.code_to_path == {encoded: "/test/path"}
+        assert path_manager.decode_path(encoded) == "/test/path"
+
+    @patch('src.utils.path_utils.MAX_PATH_ENCODINGS', 2)
+    def test_encode_path_evicts_least_recently_used(self):
+        """Test that path encodings are bounded with LRU eviction."""
+        path_manager = PathManager()
+        code1 = path_manager.encode_path("/path1")
+        code2 = path_manager.encode_path("/path2")
+        path_manager.decode_path(code1)  # Mark /path1 as recently used
+        code3 = path_manager.encode_path("/path3")
+        
+        assert len(path_manager.path_encodings) == 2
+        assert "/path2" not in path_manager.path_encodings
+        assert path_manager.decode_path(code2) == "."
+        assert path_manager.decode_path(code1) == "/path1"
+        assert path_manager.decode_path(code3) == "/path3"
+
     def test_decode_path_nonexistent_encoded(self):
         """Test decoding a nonexistent encoded path."""
         path_manager = PathManager()
@@ -91,6 +114,13 @@ class TestPathManager:
         
         assert sanitized == "file_with_backslashes.txt"
 
+    def test_sanitize_filename_with_nul_bytes(self):
+        """Test sanitizing filename with NUL bytes."""
+        path_manager = PathManager()
+        sanitized = path_manager.sanitize_filename("file\0name.txt")
+        
+        assert sanitized == "filename.txt"
+
     def test_sanitize_filename_with_whitespace(self):
         """Test sanitizing filename with whitespace."""
         path_manager = PathManager()
@@ -215,6 +245,26 @@ class TestPathManager:
         
         assert parent == "."
 
+    def test_is_path_allowed_unrestricted_by_default(self):
+        """Test that every path is allowed when no base directories are set."""
+        path_manager = PathManager()
+        
+        assert path_manager.is_path_allowed("/anywhere/at/all") is True
+
+    def test_is_path_allowed_with_base_dirs(self, tmp_path):
+        """Test that only paths under writable base directories are allowed."""
+        path_manager = PathManager()
+        base_dir = tmp_path / "downloads"
+        base_dir.mkdir()
+        
+        path_manager.set_allowed_base_dirs([str(base_dir), str(tmp_path / "missing")])
+        
+        assert path_manager.allowed_base_dirs == {str(base_dir)}
+        assert path_manager.is_path_allowed(str(base_dir)) is True
+        assert path_manager.is_path_allowed(str(base_dir / "new" / "folder")) is True
+        assert path_manager.is_path_allowed(str(base_dir / ".." / "escape")) is False
+        assert path_manager.is_path_allowed(str(tmp_path / "downloads2")) is False
+
     def test_is_safe_directory_safe_paths(self):
         """Test checking if safe directories are considered safe."""
         path_manager = PathManager()
@@ -253,54 +303,50 @@ class TestPathManager:
         for path in dangerous_paths:
             assert path_manager.is_safe_directory(path) is False
 
-    @patch('os.path.isdir')
-    @patch('os.path.exists')
-    @patch('os.listdir')
     @pytest.mark.asyncio
-    async def test_get_directory_options_success(self, mock_listdir, mock_exists, mock_isdir):
+    async def test_get_directory_options_success(self, sample_directory_structure):
         """Test getting directory options successfully."""
-        mock_exists.return_value = True
-        mock_listdir.return_value = ["folder1", "folder2", "file.txt", ".hidden"]
-        # Mock isdir to return True for folders, False for files
-        mock_isdir.side_effect = lambda path: any(folder in path for folder in ["folder1", "folder2"])
+        os.makedirs(os.path.join(sample_directory_structure, ".hidden"))
+        os.makedirs(os.path.join(sample_directory_structure, "proc"))
         
         path_manager = PathManager()
         
-        options = await path_manager.get_directory_options("/test/path")
+        options = await path_manager.get_directory_options(sample_directory_structure)
         
         assert len(options) == 2
         assert ("folder1", "dir") in options
         assert ("folder2", "dir") in options
-        assert ("file.txt", "dir") not in options  # Not a directory
+        assert ("test_file1.txt", "dir") not in options  # Not a directory
         assert (".hidden", "dir") not in options  # Hidden directory
+        assert ("proc", "dir") not in options  # System directory
 
-    @patch('os.listdir')
+    @patch('os.scandir')
     @pytest.mark.asyncio
-    async def test_get_directory_options_permission_error(self, mock_listdir):
+    async def test_get_directory_options_permission_error(self, mock_scandir):
         """Test getting directory options with permission error."""
-        mock_listdir.side_effect = PermissionError("Permission denied")
+        mock_scandir.side_effect = PermissionError("Permission denied")
         path_manager = PathManager()
         
         options = await path_manager.get_directory_options("/test/path")
         
         assert options == []
 
-    @patch('os.listdir')
+    @patch('os.scandir')
     @pytest.mark.asyncio
-    async def test_get_directory_options_os_error(self, mock_listdir):
+    async def test_get_directory_options_os_error(self, mock_scandir):
         """Test getting directory options with OSError."""
-        mock_listdir.side_effect = OSError("OS error")
+        mock_scandir.side_effect = OSError("OS error")
         path_manager = PathManager()
         
         options = await path_manager.get_directory_options("/test/path")
         
         assert options == []
 
-    @patch('os.listdir')
+    @patch('os.scandir')
     @pytest.mark.asyncio
-    async def test_get_directory_options_general_exception(self, mock_listdir):
+    async def test_get_directory_options_general_exception(self, mock_scandir):
         """Test getting directory options with general Exception."""
-        mock_listdir.side_effect = Exception("General error")
+        mock_scandir.side_effect = Exception("General error")
         path_manager = PathManager()
         
         options = await path_manager.get_directory_options("/test/path")
@@ -316,6 +362,38 @@ class TestPathManager:
         
         assert options == []
 
+    @pytest.mark.asyncio
+    async def test_get_directory_options_cached(self, sample_directory_structure):
+        """Test that directory listings are cached until a folder is created."""
+        path_manager = PathManager()
+        
+        options = await path_manager.get_directory_options(sample_directory_structure)
+        os.makedirs(os.path.join(sample_directory_structure, "folder3"))
+        cached_options = await path_manager.get_directory_options(sample_directory_structure)
+        
+        assert cached_options == options
+        
+        new_dir = os.path.join(sample_directory_structure, "folder4")
+        path_manager.ensure_directory_exists(new_dir)
+        path_manager.invalidate_directory_listing(new_dir)
+        fresh_options = await path_manager.get_directory_options(sample_directory_structure)
+        
+        assert ("folder3", "dir") in fresh_options
+        assert ("folder4", "dir") in fresh_options
+
+    @pytest.mark.asyncio
+    async def test_invalidate_directory_listing_keeps_unrelated_listings(self, sample_directory_structure):
+        """Test that creating a folder only drops the listings of its ancestors."""
+        path_manager = PathManager()
+        sibling = os.path.join(sample_directory_structure, "folder1")
+        
+        await path_manager.get_directory_options(sample_directory_structure)
+        await path_manager.get_directory_options(sibling)
+        path_manager.invalidate_directory_listing(os.path.join(sample_directory_structure, "folder2", "new"))
+        
+        assert os.path.abspath(sibling) in path_manager._dir_cache
+        assert os.path.abspath(sample_directory_structure) not in path_manager._dir_cache
+
     @pytest.mark.asyncio
     async def test_get_directory_options_empty_path(self):
         """Test getting directory options for empty path."""
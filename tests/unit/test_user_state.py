@@ -19,8 +19,8 @@ class TestUserState:
         user_state = UserState()
         user_state.set_state("123456", "logged_in", chat_id=789012)
         
-        assert user_state.user_states["123456"]["state"] == "logged_in"
-        assert user_state.user_states["123456"]["chat_id"] == 789012
+        assert user_state.user_states["123456"].state == "logged_in"
+        assert user_state.user_states["123456"].chat_id == 789012
 
     def test_set_state_existing_user(self):
         """Test setting state for an existing user."""
@@ -28,9 +28,9 @@ class TestUserState:
         user_state.set_state("123456", "awaiting_phone", chat_id=789012)
         user_state.set_state("123456", "logged_in", phone="+1234567890")
         
-        assert user_state.user_states["123456"]["state"] == "logged_in"
-        assert user_state.user_states["123456"]["chat_id"] == 789012
-        assert user_state.user_states["123456"]["phone"] == "+1234567890"
+        assert user_state.user_states["123456"].state == "logged_in"
+        assert user_state.user_states["123456"].chat_id == 789012
+        assert user_state.user_states["123456"].phone == "+1234567890"
 
     def test_get_state_existing_user(self):
         """Test getting state for an existing user."""
@@ -79,7 +79,7 @@ class TestUserState:
         user_state = UserState()
         user_state.set_user_data("123456", "phone", "+1234567890")
         
-        assert user_state.user_states["123456"]["phone"] == "+1234567890"
+        assert user_state.user_states["123456"].phone == "+1234567890"
 
     def test_set_user_data_existing_user(self):
         """Test setting user data for an existing user."""
@@ -87,17 +87,17 @@ class TestUserState:
         user_state.set_state("123456", "logged_in")
         user_state.set_user_data("123456", "phone", "+1234567890")
         
-        assert user_state.user_states["123456"]["state"] == "logged_in"
-        assert user_state.user_states["123456"]["phone"] == "+1234567890"
+        assert user_state.user_states["123456"].state == "logged_in"
+        assert user_state.user_states["123456"].phone == "+1234567890"
 
     def test_update_user_data_multiple_fields(self):
         """Test updating multiple user data fields."""
         user_state = UserState()
         user_state.update_user_data("123456", phone="+1234567890", code="123456", chat_id=789012)
         
-        assert user_state.user_states["123456"]["phone"] == "+1234567890"
-        assert user_state.user_states["123456"]["code"] == "123456"
-        assert user_state.user_states["123456"]["chat_id"] == 789012
+        assert user_state.user_states["123456"].phone == "+1234567890"
+        assert user_state.user_states["123456"].code == "123456"
+        assert user_state.user_states["123456"].chat_id == 789012
 
     def test_update_user_data_existing_user(self):
         """Test updating user data for an existing user."""
@@ -105,8 +105,20 @@ class TestUserState:
         user_state.set_state("123456", "logged_in")
         user_state.update_user_data("123456", phone="+1234567890")
         
-        assert user_state.user_states["123456"]["state"] == "logged_in"
-        assert user_state.user_states["123456"]["phone"] == "+1234567890"
+        assert user_state.user_states["123456"].state == "logged_in"
+        assert user_state.user_states["123456"].phone == "+1234567890"
+
+    def test_user_data_without_field_kept_in_extra(self):
+        """Test that data without a session field is stored alongside it."""
+        user_state = UserState()
+        user_state.set_state("123456", "logged_in", chat_id=789012)
+        user_state.set_user_data("123456", "temp_data", "test_value")
+        
+        session = user_state.user_states["123456"]
+        assert not hasattr(session, '__dict__')
+        assert session.extra == {"temp_data": "test_value"}
+        assert user_state.get_user_data("123456", "temp_data") == "test_value"
+        assert user_state.get_user_data("123456", "chat_id") == 789012
 
     def test_clear_user_state_existing_user(self):
         """Test clearing state for an existing user."""
@@ -146,23 +158,23 @@ class TestUserState:
     def test_is_authorized_true(self):
         """Test is_authorized returns True for authorized user."""
         user_state = UserState()
-        allowed_users = {"123456", "789012"}
+        allowed_users = frozenset({123456, 789012})
         
-        assert user_state.is_authorized("123456", allowed_users) is True
+        assert user_state.is_authorized(123456, allowed_users) is True
 
     def test_is_authorized_false(self):
         """Test is_authorized returns False for unauthorized user."""
         user_state = UserState()
-        allowed_users = {"123456", "789012"}
+        allowed_users = frozenset({123456, 789012})
         
-        assert user_state.is_authorized("345678", allowed_users) is False
+        assert user_state.is_authorized(345678, allowed_users) is False
 
     def test_is_authorized_empty_allowed_users(self):
         """Test is_authorized with empty allowed users set."""
         user_state = UserState()
         allowed_users = set()
         
-        assert user_state.is_authorized("123456", allowed_users) is False
+        assert user_state.is_authorized(123456, allowed_users) is False
 
     def test_get_chat_id_existing_user(self):
         """Test getting chat_id for an existing user."""
@@ -183,7 +195,7 @@ class TestUserState:
         user_state = UserState()
         user_state.set_chat_id("123456", 789012)
         
-        assert user_state.user_states["123456"]["chat_id"] == 789012
+        assert user_state.user_states["123456"].chat_id == 789012
 
     def test_set_chat_id_existing_user(self):
         """Test setting chat_id for an existing user."""
@@ -191,8 +203,8 @@ class TestUserState:
         user_state.set_state("123456", "logged_in")
         user_state.set_chat_id("123456", 789012)
         
-        assert user_state.user_states["123456"]["state"] == "logged_in"
-        assert user_state.user_states["123456"]["chat_id"] == 789012
+        assert user_state.user_states["123456"].state == "logged_in"
+        assert user_state.user_states["123456"].chat_id == 789012
 
     def test_state_transitions(self):
         """Test various state transitions."""
@@ -223,4 +235,33 @@ class TestUserState:
         assert user_state.get_state("user1") == "awaiting_phone"
         assert user_state.get_state("user2") == "logged_in"
         assert user_state.get_chat_id("user1") == 111111
-        assert user_state.get_chat_id("user2") == 222222 
\ No newline at end of file
+        assert user_state.get_chat_id("user2") == 222222 
+    def test_evict_idle_users(self):
+        """Test that idle users are evicted unless they are logged in."""
+        import time
+        from unittest.mock import patch
+        user_state = UserState()
+        user_state.set_state("idle", "awaiting_filename")
+        user_state.set_state("logged", "logged_in")
+        user_state.set_state("active", "awaiting_filename")
+        
+        with patch('src.core.user_state.time.monotonic', return_value=time.monotonic() + 7200):
+            user_state.set_state("active", "selecting_directory")
+            evicted = user_state.evict_idle_users(3600)
+        
+        assert evicted == 1
+        assert "idle" not in user_state.user_states
+        assert user_state.get_state("logged") == "logged_in"
+        assert user_state.get_state("active") == "selecting_directory"
+
+    def test_writes_refresh_last_touch(self):
+        """Test that writing user data keeps a user from being evicted."""
+        import time
+        from unittest.mock import patch
+        user_state = UserState()
+        user_state.set_state("123456", "awaiting_filename")
+        
+        later = time.monotonic() + 7200
+        with patch('src.core.user_state.time.monotonic', return_value=later):
+            user_state.set_user_data("123456", "selected_dir", "/tmp")
+            assert user_state.evict_idle_users(3600) == 0